@@ -1,15 +1,21 @@
 from flask import Flask
 from auth.routes import auth_bp
+from auth.prewarm import start_prewarm_scheduler
 from views.views import views_bp
-import secrets
+from utils.sessions import load_secret_key, make_session_interface
 import os
 
 app = Flask(__name__)
-app.secret_key = secrets.token_hex(16)
+# The same key in every worker process, and sessions stored server-side so
+# the cookie only carries a signed session id.
+app.secret_key = load_secret_key()
+app.session_interface = make_session_interface()
 
 app.register_blueprint(auth_bp)
 app.register_blueprint(views_bp)
 
+start_prewarm_scheduler()
+
 
 # if __name__ == "__main__":
 #     app.run(debug=True, port=5000)
\ No newline at end of file
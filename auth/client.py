@@ -0,0 +1,351 @@
+import os
+import json
+import time
+import fcntl
+import hashlib
+import threading
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from utils.files import replacing, TEMP_DIR
+
+# Maximum number of in-flight requests per upstream host, shared by every
+# fetcher and every setup job running in this process.
+HOST_LIMITS = {
+    "api.spotify.com": int(os.environ.get("SPOTIFY_CONCURRENCY", 8)),
+    "ws.audioscrobbler.com": int(os.environ.get("LASTFM_CONCURRENCY", 8)),
+}
+# Sustained requests per second allowed per upstream host.
+HOST_RATES = {
+    "api.spotify.com": float(os.environ.get("SPOTIFY_RATE", 20)),
+    "ws.audioscrobbler.com": float(os.environ.get("LASTFM_RATE", 5)),
+}
+DEFAULT_HOST_LIMIT = 4
+DEFAULT_HOST_RATE = 10.0
+DEFAULT_TIMEOUT = 30
+MAX_RETRIES = 4
+BACKOFF = 1.0
+# A Retry-After longer than this is not waited out; the response is returned
+# to the caller instead of parking a worker thread for minutes.
+MAX_RETRY_AFTER = 120
+# Identical GETs in flight at the same time are made once and share the
+# response: within a process directly, and for requests without a user token
+# across worker processes through striped lock files and a response file
+# under FLIGHTS_DIR.
+FLIGHTS_DIR = os.path.join(TEMP_DIR, "flights")
+FLIGHT_LOCK_STRIPES = 1024
+FLIGHT_WAIT = 60
+FLIGHT_SWEEP_INTERVAL = 300
+
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=len(HOST_LIMITS) + 2, pool_maxsize=max(HOST_LIMITS.values()))
+_session.mount("https://", _adapter)
+_session.mount("http://", _adapter)
+
+# One fan-out pool per upstream host, sized to that host's concurrency limit,
+# so Last.fm lookups queued during playlist paging do not wait behind the
+# remaining Spotify work (and vice versa).
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def executor_for(url):
+    """Return the shared thread pool for work against url's host."""
+    host = urlparse(url).netloc or url
+    with _executors_lock:
+        if host not in _executors:
+            _executors[host] = ThreadPoolExecutor(max_workers=HOST_LIMITS.get(host, DEFAULT_HOST_LIMIT),
+                                                  thread_name_prefix=f"playlistr-{host}")
+        return _executors[host]
+
+
+class HostLimiter:
+    """Token bucket plus AIMD concurrency window for one upstream host.
+
+    Each request takes a token (refilled at ``rate`` per second) and a slot in
+    the concurrency window. A throttled response halves the window and, when
+    the server sends Retry-After, blocks every caller until it has passed.
+    Successful responses grow the window back by one slot per full window.
+    """
+
+    def __init__(self, rate, max_concurrency):
+        self.rate = rate
+        self.capacity = max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.max_concurrency = max_concurrency
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.throttled = 0
+        self.cond = threading.Condition()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self.blocked_until - now
+                if wait <= 0:
+                    if self.tokens >= 1 and self.in_flight < int(self.limit):
+                        self.tokens -= 1
+                        self.in_flight += 1
+                        return
+                    wait = (1 - self.tokens) / self.rate if self.tokens < 1 else None
+                self.cond.wait(timeout=wait)
+
+    def release(self, throttled=False, retry_after=None):
+        with self.cond:
+            self.in_flight -= 1
+            if throttled:
+                self.throttled += 1
+                self.limit = max(1.0, self.limit / 2)
+                if retry_after:
+                    self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+            else:
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+            self.cond.notify_all()
+
+    def stats(self):
+        with self.cond:
+            return {
+                "concurrency_limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "throttled": self.throttled,
+                "blocked_for": round(max(0.0, self.blocked_until - time.monotonic()), 1),
+            }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def _limiter_for(host):
+    with _limiters_lock:
+        if host not in _limiters:
+            _limiters[host] = HostLimiter(HOST_RATES.get(host, DEFAULT_HOST_RATE),
+                                          HOST_LIMITS.get(host, DEFAULT_HOST_LIMIT))
+        return _limiters[host]
+
+
+def _is_throttled(host, res):
+    if res.status_code == 429:
+        return True
+    # Last.fm reports "Rate limit exceeded" as error 29 in the body.
+    if host == "ws.audioscrobbler.com":
+        return b'"error":29' in res.content or b'code="29"' in res.content
+    return False
+
+
+def _retry_after(res):
+    value = res.headers.get("Retry-After")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+_flight_stats = {"calls": 0, "coalesced_local": 0, "coalesced_shared": 0}
+_last_sweep = 0.0
+
+
+def _count(name):
+    with _flights_lock:
+        _flight_stats[name] += 1
+
+
+def _flight_key(url, params, headers):
+    # The Authorization header is part of the key: responses are only shared
+    # between callers that would have sent exactly the same request.
+    return json.dumps([url, sorted((params or {}).items()), (headers or {}).get("Authorization")],
+                      default=str)
+
+
+def _write_response(path, res):
+    meta = {"status": res.status_code, "url": res.url, "encoding": res.encoding, "headers": dict(res.headers)}
+    with replacing(path) as tmp_path, open(tmp_path, "wb") as f:
+        f.write(json.dumps(meta).encode() + b"\n" + res.content)
+
+
+def _read_response(path, since):
+    try:
+        if os.path.getmtime(path) < since:
+            return None
+        with open(path, "rb") as f:
+            meta, content = f.read().split(b"\n", 1)
+    except (FileNotFoundError, ValueError):
+        return None
+    meta = json.loads(meta)
+    res = requests.Response()
+    res.status_code = meta["status"]
+    res.url = meta["url"]
+    res.encoding = meta["encoding"]
+    res.headers = CaseInsensitiveDict(meta["headers"])
+    res._content = content
+    return res
+
+
+def _sweep_flights():
+    """Delete response files too old for any waiting process to use."""
+    global _last_sweep
+    now = time.time()
+    with _flights_lock:
+        if now - _last_sweep < FLIGHT_SWEEP_INTERVAL:
+            return
+        _last_sweep = now
+    for entry in os.scandir(FLIGHTS_DIR):
+        if entry.name.endswith(".resp"):
+            try:
+                if entry.stat().st_mtime < now - FLIGHT_WAIT:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+def _shared_flight(key, fetch):
+    """Run fetch() unless another process is already making the same request.
+
+    The lock is held while fetching; a process that had to wait for it reuses
+    the response file the holder wrote, if it was written after the wait began.
+    """
+    digest = hashlib.sha1(key.encode()).hexdigest()
+    stripe = int(digest[:8], 16) % FLIGHT_LOCK_STRIPES
+    os.makedirs(FLIGHTS_DIR, exist_ok=True)
+    response_path = os.path.join(FLIGHTS_DIR, f"{digest}.resp")
+    waited_since = time.time()
+    with open(os.path.join(FLIGHTS_DIR, f"{stripe}.lock"), "a") as lock:
+        waited = False
+        deadline = time.monotonic() + FLIGHT_WAIT
+        while True:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                locked = True
+                break
+            except BlockingIOError:
+                waited = True
+                if time.monotonic() > deadline:
+                    locked = False
+                    break
+                time.sleep(0.05)
+        try:
+            if waited:
+                res = _read_response(response_path, waited_since)
+                if res is not None:
+                    _count("coalesced_shared")
+                    return res
+            res = fetch()
+            if res.status_code == 200:
+                _write_response(response_path, res)
+                _sweep_flights()
+            return res
+        finally:
+            if locked:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def get(url, params=None, headers=None, timeout=DEFAULT_TIMEOUT, max_retries=MAX_RETRIES):
+    """GET through the shared session, coalescing identical concurrent requests.
+
+    The first caller for a given url, params and Authorization header makes
+    the request; callers that ask for the same thing while it is in flight
+    wait for it and get the same response (or exception).
+    """
+    key = _flight_key(url, params, headers)
+    with _flights_lock:
+        _flight_stats["calls"] += 1
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+        else:
+            _flight_stats["coalesced_local"] += 1
+
+    if not leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.response
+
+    fetch = lambda: _get(url, params=params, headers=headers, timeout=timeout, max_retries=max_retries)
+    try:
+        # Requests made with a user's token are only coalesced in-process, so
+        # their responses are never written to the shared flights directory.
+        if headers and "Authorization" in headers:
+            flight.response = fetch()
+        else:
+            flight.response = _shared_flight(key, fetch)
+        return flight.response
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+
+
+def _get(url, params=None, headers=None, timeout=DEFAULT_TIMEOUT, max_retries=MAX_RETRIES):
+    """GET through the shared keep-alive session under the host's rate limiter.
+
+    Throttled responses are retried after Retry-After (or exponential backoff
+    when the server gives none); 5xx responses and connection errors are
+    retried with backoff. The last response is returned once retries run out.
+    """
+    host = urlparse(url).netloc
+    limiter = _limiter_for(host)
+    for attempt in range(max_retries + 1):
+        backoff = BACKOFF * 2 ** attempt
+        limiter.acquire()
+        try:
+            res = _session.get(url, params=params, headers=headers, timeout=timeout)
+        except requests.RequestException:
+            limiter.release()
+            if attempt == max_retries:
+                raise
+            time.sleep(backoff)
+            continue
+
+        throttled = _is_throttled(host, res)
+        retry_after = (_retry_after(res) or backoff) if throttled else None
+        limiter.release(throttled, min(retry_after, MAX_RETRY_AFTER) if throttled else None)
+
+        if attempt == max_retries:
+            return res
+        if throttled:
+            if retry_after > MAX_RETRY_AFTER:
+                print(f"[Client] {host} asked to retry after {retry_after:.0f}s, giving up on {url}")
+                return res
+            print(f"[Client] {host} throttled, retrying in {retry_after:.1f}s")
+            continue
+        if res.status_code >= 500:
+            time.sleep(backoff)
+            continue
+        return res
+
+
+def limiter_stats():
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {host: limiter.stats() for host, limiter in limiters.items()}
+
+
+def flight_stats():
+    with _flights_lock:
+        stats = dict(_flight_stats)
+    stats["saved"] = stats["coalesced_local"] + stats["coalesced_shared"]
+    return stats
@@ -1,32 +1,51 @@
 import pycountry
 import json
 import os
+import threading
 import pandas as pd
-import requests
 from xml.etree import ElementTree as ET
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import time
+from concurrent.futures import as_completed
 from flask import session
-
-
-def id_header_col_info():
-    user_info = session.get('user_info')
-    user_id = user_info.get('id') if user_info else None
-
-    access_token = session.get("access_token")
+from . import client
+from utils.cache import get_artist_cache, get_similar_cache, normalize_key
+from utils.manifest import value_hash
+from utils.store import read_dataset, iter_dataset, dataset_exists, datasets_dir, DatasetWriter
+from .tracks import TRACK_FIELDS, TrackColumns, TrackStream, tracks_frame
+
+SPOTIFY_API = "https://api.spotify.com/v1"
+LASTFM_API = "http://ws.audioscrobbler.com/2.0/"
+# Where artist genres come from: "spotify" resolves them in batches through
+# /v1/artists and only falls back to Last.fm per artist; "lastfm" always
+# uses Last.fm artist.getInfo.
+ARTIST_INFO_SOURCE = os.environ.get("ARTIST_INFO_SOURCE", "spotify")
+SPOTIFY_ARTISTS_BATCH = 50
+# Columns the enrich stage adds from artist info. "playcount" holds Last.fm
+# listeners and "followers" Spotify followers; each is missing for artists
+# that were not looked up on that service.
+ARTIST_FIELDS = ["genres", "playcount", "followers", "popularity"]
+
+# Playlist tracks are streamed to the user_songs_raw dataset while paging,
+# then enriched chunk by chunk into user_songs. A chunk is written once it has
+# INGEST_CHUNK_ROWS rows or holds about INGEST_MEMORY_MB of parsed values.
+INGEST_CHUNK_ROWS = int(os.environ.get("PLAYLISTR_INGEST_CHUNK_ROWS", 5000))
+INGEST_MEMORY_MB = float(os.environ.get("PLAYLISTR_INGEST_MEMORY_MB", 16))
+USER_SONGS_RAW = "user_songs_raw"
+USER_SONGS_COLUMNS = ["playlist", *TRACK_FIELDS, "playlist_id", "snapshot_id"]
+
+
+def id_header_col_info(user_id, access_token):
     headers = {"Authorization": f"Bearer {access_token}"}
 
-    fieldnames = ["playlist", "name", "name_url", "artist",
-                  "album", "year", "album_art"]
+    fieldnames = ["playlist", *TRACK_FIELDS]
 
     return user_id, headers, fieldnames
 
 def fetch_user_info():
     print("[DataEDA] Fetching user info from Spotify...")
-    _, headers, fieldnames = id_header_col_info()
+    _, headers, fieldnames = id_header_col_info(None, session.get("access_token"))
     url = "https://api.spotify.com/v1/me"
     try:
-        res = requests.get(url, headers=headers, timeout=30)
+        res = client.get(url, headers=headers)
         res.raise_for_status()
         data = res.json()
 
@@ -49,24 +68,51 @@ def fetch_user_info():
         print(f"[DataEDA] Failed to fetch user details: {e}")
         raise
 
-def save_user_info():
-    user_id = session.get("user_info").get("id")
-    datasets_dir = os.path.join("temp", user_id, "datasets")
-    print(f"[DataEDA] Saving user info to {datasets_dir}...")
-    user_info_file = os.path.join(datasets_dir, "user_info.json")
+def save_user_info(user_info):
+    user_id = user_info.get("id")
+    print(f"[DataEDA] Saving user info to {datasets_dir(user_id)}...")
+    user_info_file = os.path.join(datasets_dir(user_id), "user_info.json")
     with open(user_info_file, "w") as f:
-        json.dump(session['user_info'], f, indent=4)
+        json.dump(user_info, f, indent=4)
     print(f"[DataEDA] User info saved to {user_info_file}")
 
 
-def fetch_save_user_tracks():
-    user_id, headers, fieldnames = id_header_col_info()
+def stored_user_tracks(user_id):
+    """Name of the dataset holding the user's last fetched playlist rows, or None."""
+    for name in (USER_SONGS_RAW, "user_songs"):
+        if dataset_exists(user_id, name):
+            return name
+    return None
+
+
+def load_playlist_snapshots(user_id, name="user_songs"):
+    """Return the {playlist_id: snapshot_id} map of the stored ``name`` rows."""
+    df = read_dataset(user_id, name, columns=["playlist_id", "snapshot_id"])
+    if df is None or "snapshot_id" not in df.columns or "playlist_id" not in df.columns:
+        return {}
+    return df.dropna(subset=["playlist_id"]).groupby("playlist_id")["snapshot_id"].first().to_dict()
+
+
+def fetch_user_tracks(user_info, access_token, progress=None, incremental=False, on_artists=None):
+    """Fetch every playlist's tracks into the user_songs_raw dataset.
+
+    Pages are parsed as they arrive and written out in chunks (see
+    INGEST_CHUNK_ROWS), so memory does not grow with the library size;
+    write_user_tracks() turns the raw rows into user_songs. Returns the
+    TrackStream with the row and buffer statistics.
+
+    With incremental=True, playlists whose snapshot_id matches the one stored
+    with their rows are not refetched; their existing rows are kept as-is.
+    on_artists, if given, is called with the (artist, artist id) pairs of each page as
+    soon as it arrives, so enrichment can start while paging continues.
+    """
+    user_id, headers, _ = id_header_col_info(user_info.get("id"), access_token)
     print("[DataEDA] Fetching user playlists from Spotify...")
     playlists = []
     next_url = "https://api.spotify.com/v1/me/playlists?limit=50"
 
     while next_url:
-        res = requests.get(next_url, headers=headers)
+        res = client.get(next_url, headers=headers)
         res.raise_for_status()
         data = res.json()
         playlists.extend(data.get("items", []))
@@ -74,330 +120,391 @@ def fetch_save_user_tracks():
 
     total_playlists = len(playlists)
     total_playlist_tracks = sum(pl.get("tracks", {}).get("total", 0) for pl in playlists)
-    session['user_info']['total_playlists'] = total_playlists
-    session['user_info']['total_tracks'] = total_playlist_tracks
+    user_info['total_playlists'] = total_playlists
+    user_info['total_tracks'] = total_playlist_tracks
     print(f"[DataEDA] Found {total_playlists} playlists with {total_playlist_tracks} total tracks")
 
+    stored = stored_user_tracks(user_id) if incremental else None
+    stored_snapshots = load_playlist_snapshots(user_id, stored) if stored else {}
+    unchanged = {pl["id"] for pl in playlists
+                 if pl.get("id") in stored_snapshots and stored_snapshots[pl["id"]] == pl.get("snapshot_id")}
+    changed = [pl for pl in playlists if pl.get("id") not in unchanged]
+    if incremental:
+        print(f"[DataEDA] {len(unchanged)} playlists unchanged since last sync, refetching {len(changed)}")
+    if progress:
+        progress("playlists", len(unchanged), total_playlists,
+                 f"Found {total_playlists} playlists with {total_playlist_tracks} tracks")
+
+    writer = DatasetWriter(user_id, USER_SONGS_RAW, columns=USER_SONGS_COLUMNS)
+    stream = TrackStream(writer, INGEST_CHUNK_ROWS, INGEST_MEMORY_MB * 1024 * 1024, with_playlist_ids=True)
+
     def fetch_tracks(pl):
-        tracks = []
-        pl_name = pl.get("name", "Unnamed Playlist")
+        name, total = pl.get("name", "Unnamed Playlist"), 0
         url = pl["tracks"]["href"]
         while url:
-            res = requests.get(url, headers=headers)
+            res = client.get(url, headers=headers)
             res.raise_for_status()
             data = res.json()
 
-            for item in data.get("items", []):
-                t = item.get("track")
-                if not t:
-                    continue
-                artist = t.get("artists", [{}])[0].get("name", "")
-                album = t.get("album", {})
-                release_date = album.get("release_date", "1900")
-                year = int(release_date[:4]) if release_date else 1900
-                album_images = album.get("images", [{}])
-                album_art = album_images[0].get("url", "")
-
-                tracks.append({
-                    "playlist": pl_name,
-                    "name": t.get("name", ""),
-                    "name_url": t.get("external_urls", {}).get("spotify", ""),
-                    "artist": artist,
-                    "album": album.get("name", ""),
-                    "year": year,
-                    "album_art": album_art,
-                })
-
+            batch = TrackColumns(name, pl.get("id"), pl.get("snapshot_id"))
+            batch.add_items(data.get("items", []))
+            if on_artists and len(batch):
+                on_artists(batch.artist_refs())
+            stream.add(batch)
+            total += len(batch)
             url = data.get("next")
-        print(f"[DataEDA] {pl_name}: collected {len(tracks)} tracks")
-        return tracks
+        print(f"[DataEDA] {name}: collected {total} tracks")
+        return total
 
-    all_tracks = []
+    failed_ids = set()
     print("[DataEDA] Fetching tracks from all playlists concurrently...")
-    with ThreadPoolExecutor(max_workers=8) as executor:
-        futures = {executor.submit(fetch_tracks, pl): pl.get("name", "Unnamed Playlist") for pl in playlists}
-        for f in as_completed(futures):
+    try:
+        executor = client.executor_for(SPOTIFY_API)
+        futures = {executor.submit(fetch_tracks, pl): pl for pl in changed}
+        for done, f in enumerate(as_completed(futures), start=1):
+            pl_name = futures[f].get("name", "Unnamed Playlist")
             try:
-                all_tracks.extend(f.result())
+                message = f"{pl_name}: {f.result()} tracks"
             except Exception as e:
-                print(f"[DataEDA] Error fetching playlist '{futures[f]}': {e}")
-
-    datasets_dir = os.path.join("temp", user_id, "datasets")
-    os.makedirs(datasets_dir, exist_ok=True)
-    csv_file = os.path.join(datasets_dir, "user_songs.csv")
-
-    print(f"[DataEDA] Saving all tracks to {csv_file}...")
-    df = pd.DataFrame(all_tracks, columns=fieldnames)
-    df.to_csv(csv_file, index=False)
-    print(f"[DataEDA] Saved {len(all_tracks)} tracks to {csv_file}")
-
-
-def fetch_save_top_tracks():
-    user_id, headers, fieldnames = id_header_col_info()
-
-    url = f"https://api.spotify.com/v1/me/top/tracks?limit=50"
-
-    res = requests.get(url, headers=headers)
-    res.raise_for_status()
-    data = res.json()
-
-    top_tracks = []
-    for t in data.get("items", []):
-        artist_name = t["artists"][0]["name"] if t.get("artists") else ""
-        release_date = t.get("album", {}).get("release_date", "1900")
-        year = int(release_date[:4]) if release_date else 1900
-
-        track_info = {
-            "playlist": "Top Tracks",
-            "name": t.get("name"),
-            "name_url": t.get("external_urls", {}).get("spotify", ""),
-            "artist": artist_name,
-            "artist_url": t.get("artists")[0].get("external_urls", {}).get("spotify", "") if t.get("artists") else "",
-            "album": t.get("album", {}).get("name", ""),
-            "album_url": t.get("album", {}).get("external_urls", {}).get("spotify", ""),
-            "year": year,
-            "album_art": t.get("album", {}).get("images", [{}])[0].get("url", ""),
-            "genres": "",
-            "similar_songs": ""
-        }
-        top_tracks.append(track_info)
-
-    datasets_dir = os.path.join("temp", user_id, "datasets")
-    csv_file = os.path.join(datasets_dir, "top_tracks.csv")
+                # Pages already streamed for this playlist are dropped with
+                # the rest of its raw rows below.
+                failed_ids.add(futures[f].get("id"))
+                message = f"{pl_name}: failed"
+                print(f"[DataEDA] Error fetching playlist '{pl_name}': {e}")
+            if progress:
+                progress("playlists", len(unchanged) + done, total_playlists, message)
+        stream.flush()
+
+        if stored:
+            # Keep stored rows for unchanged playlists, and for changed ones whose
+            # refetch failed, rather than dropping them from the dataset.
+            names = {pl["id"]: pl.get("name", "Unnamed Playlist") for pl in playlists if pl.get("id")}
+            keep = unchanged | failed_ids
+            for chunk in iter_dataset(user_id, stored, columns=USER_SONGS_COLUMNS, batch_rows=INGEST_CHUNK_ROWS):
+                kept = chunk[chunk["playlist_id"].isin(keep)].copy()
+                kept["playlist"] = kept["playlist_id"].map(names)
+                kept = kept.reindex(columns=USER_SONGS_COLUMNS)
+                stream.write_frame(kept)
+                if on_artists:
+                    on_artists(zip(kept["artist"], kept["artist_id"]))
+        writer.close()
+    except Exception:
+        writer.abort()
+        raise
+    finally:
+        stream.close()
 
-    df = pd.DataFrame(top_tracks, columns=fieldnames)
-    df.to_csv(csv_file, index=False)
+    # Pages streamed before a playlist failed are dropped; its stored rows,
+    # if any, were kept above and carry the old snapshot_id.
+    partial = {pl["id"]: pl.get("snapshot_id") for pl in changed if pl.get("id") in failed_ids}
+    rows = drop_raw_playlists(user_id, partial) if partial else writer.rows
 
-    print(f"[DataEDA] Saved {len(top_tracks)} top tracks to {csv_file}")
+    print(f"[DataEDA] Collected {rows} tracks for user {user_id} in {stream.chunks} chunks")
+    return stream
 
-def fetch_save_recent_tracks():
-    user_id, headers, fieldnames = id_header_col_info()
-    url = f"https://api.spotify.com/v1/me/player/recently-played?limit=50"
 
-    res = requests.get(url, headers=headers)
-    res.raise_for_status()
-    data = res.json()
+def drop_raw_playlists(user_id, snapshots):
+    """Rewrite the raw user_songs rows without those of the {playlist_id: snapshot_id} pairs.
 
-    recent_tracks = []
-    for item in data.get("items", []):
-        t = item.get("track")
-        if not t:
-            continue
-        artist_name = t.get("artists", [{}])[0].get("name", "")
-        album = t.get("album", {})
-        release_date = album.get("release_date", "1900")
-        year = int(release_date[:4]) if release_date else 1900
-        album_art = album.get("images", [{}])[0].get("url", "")
-
-        track_info = {
-            "playlist": "Recent Tracks",
-            "name": t.get("name", ""),
-            "name_url": t.get("external_urls", {}).get("spotify", ""),
-            "artist": artist_name,
-            "artist_url": t.get("artists", [{}])[0].get("external_urls", {}).get("spotify", ""),
-            "album": album.get("name", ""),
-            "album_url": album.get("external_urls", {}).get("spotify", ""),
-            "year": year,
-            "album_art": album_art,
-            "genres": "",
-            "similar_songs": ""
-        }
-        recent_tracks.append(track_info)
+    Returns the number of rows left.
+    """
+    writer = DatasetWriter(user_id, USER_SONGS_RAW, columns=USER_SONGS_COLUMNS)
+    try:
+        for chunk in iter_dataset(user_id, USER_SONGS_RAW, batch_rows=INGEST_CHUNK_ROWS):
+            partial = chunk["playlist_id"].map(snapshots)
+            writer.write(chunk[partial.isna() | partial.ne(chunk["snapshot_id"])])
+        writer.close()
+    except Exception:
+        writer.abort()
+        raise
+    return writer.rows
 
-    datasets_dir = os.path.join("temp", str(user_id), "datasets")
-    csv_file = os.path.join(datasets_dir, "recent_tracks.csv")
 
-    df = pd.DataFrame(recent_tracks, columns=fieldnames)
-    df.to_csv(csv_file, index=False)
+def playlist_fingerprint(user_id):
+    """Hash of which playlists, at which snapshot, the raw user_songs rows hold.
 
-    print(f"[DataEDA] Saved {len(recent_tracks)} recent tracks to {csv_file}")
+    Unlike a hash of the file, it does not depend on the order the fetch
+    threads happened to write the rows in.
+    """
+    df = read_dataset(user_id, USER_SONGS_RAW, columns=["playlist_id", "snapshot_id", "playlist"])
+    if df is None:
+        return None
+    counts = df.groupby(["playlist_id", "snapshot_id", "playlist"], dropna=False).size()
+    return value_hash(sorted([*map(str, key), int(n)] for key, n in counts.items()))
 
 
-def fetch_save_top_tracks():
-    user_id, headers, fieldnames = id_header_col_info()
-    print("[DataEDA] Fetching top tracks from Spotify...")
+def dataset_artists(user_id, name):
+    """Yield the (artist, artist id) pairs of a stored dataset, chunk by chunk."""
+    for chunk in iter_dataset(user_id, name, columns=["artist", "artist_id"], batch_rows=INGEST_CHUNK_ROWS):
+        ids = chunk["artist_id"] if "artist_id" in chunk.columns else [None] * len(chunk)
+        yield from zip(chunk["artist"], ids)
 
-    url = "https://api.spotify.com/v1/me/top/tracks?limit=50"
-    res = requests.get(url, headers=headers)
-    res.raise_for_status()
-    data = res.json()
-
-    top_tracks = []
-    for t in data.get("items", []):
-        artist_name = t.get("artists", [{}])[0].get("name", "")
-        album = t.get("album", {})
-        release_date = album.get("release_date", "1900")
-        year = int(release_date[:4]) if release_date else 1900
-        album_art = album.get("images", [{}])[0].get("url", "")
-
-        track_info = {
-            "playlist": "Top Tracks",
-            "name": t.get("name", ""),
-            "name_url": t.get("external_urls", {}).get("spotify", ""),
-            "artist": artist_name,
-            "artist_url": t.get("artists", [{}])[0].get("external_urls", {}).get("spotify", ""),
-            "album": album.get("name", ""),
-            "album_url": album.get("external_urls", {}).get("spotify", ""),
-            "year": year,
-            "album_art": album_art,
-            "genres": "",
-            "similar_songs": ""
-        }
-        top_tracks.append(track_info)
 
-    datasets_dir = os.path.join("temp", str(user_id), "datasets")
-    os.makedirs(datasets_dir, exist_ok=True)
-    csv_file = os.path.join(datasets_dir, "top_tracks.csv")
+def write_user_tracks(user_id, artists):
+    """Write the raw playlist rows, with artist info applied, as the user_songs dataset.
 
-    df = pd.DataFrame(top_tracks, columns=fieldnames)
-    df.to_csv(csv_file, index=False)
-    print(f"[DataEDA] Saved {len(top_tracks)} top tracks to {csv_file}")
+    Rows are enriched and written one chunk at a time. Returns the number of
+    rows written.
+    """
+    writer = DatasetWriter(user_id, "user_songs", columns=[*USER_SONGS_COLUMNS, *ARTIST_FIELDS])
+    try:
+        for chunk in iter_dataset(user_id, USER_SONGS_RAW, batch_rows=INGEST_CHUNK_ROWS):
+            writer.write(apply_artist_info(chunk, artists))
+        path = writer.close()
+    except Exception:
+        writer.abort()
+        raise
+    print(f"[DataEDA] Saved {writer.rows} rows to {path}")
+    return writer.rows
 
-def fetch_save_recent_tracks():
-    user_id, headers, fieldnames = id_header_col_info()
-    print("[DataEDA] Fetching recently played tracks from Spotify...")
 
-    url = "https://api.spotify.com/v1/me/player/recently-played?limit=50"
-    res = requests.get(url, headers=headers)
+def fetch_listening_tracks(access_token, url, playlist, on_artists=None):
+    """Fetch one page of top or recently played tracks as a frame labelled ``playlist``."""
+    _, headers, _ = id_header_col_info(None, access_token)
+    res = client.get(url, headers=headers)
     res.raise_for_status()
-    data = res.json()
-
-    recent_tracks = []
-    for item in data.get("items", []):
-        t = item.get("track")
-        if not t:
-            continue
-        artist_name = t.get("artists", [{}])[0].get("name", "")
-        album = t.get("album", {})
-        release_date = album.get("release_date", "1900")
-        year = int(release_date[:4]) if release_date else 1900
-        album_art = album.get("images", [{}])[0].get("url", "")
-
-        track_info = {
-            "playlist": "Recent Tracks",
-            "name": t.get("name", ""),
-            "name_url": t.get("external_urls", {}).get("spotify", ""),
-            "artist": artist_name,
-            "artist_url": t.get("artists", [{}])[0].get("external_urls", {}).get("spotify", ""),
-            "album": album.get("name", ""),
-            "album_url": album.get("external_urls", {}).get("spotify", ""),
-            "year": year,
-            "album_art": album_art,
-            "genres": "",
-            "similar_songs": ""
-        }
-        recent_tracks.append(track_info)
-
-    datasets_dir = os.path.join("temp", str(user_id), "datasets")
-    os.makedirs(datasets_dir, exist_ok=True)
-    csv_file = os.path.join(datasets_dir, "recent_tracks.csv")
-
-    df = pd.DataFrame(recent_tracks, columns=fieldnames)
-    df.to_csv(csv_file, index=False)
-    print(f"[DataEDA] Saved {len(recent_tracks)} recent tracks to {csv_file}")
 
+    batch = TrackColumns(playlist)
+    batch.add_items(res.json().get("items", []))
+    if on_artists:
+        on_artists(batch.artist_refs())
+    print(f"[DataEDA] Collected {len(batch)} {playlist.lower()}")
+    return tracks_frame([batch])
 
 
-def enrich_songs_with_lastfm(lastfm_api_key, max_workers=8, retry_count=3, backoff=2):
-    user_id = session.get("user_info").get("id")
-    datasets_dir = os.path.join("temp", user_id, "datasets")
-    csv_files = ["user_songs.csv", "top_tracks.csv", "recent_tracks.csv"]
-
-    dfs = {}
-    for f in csv_files:
-        path = os.path.join(datasets_dir, f)
-        if os.path.exists(path):
-            dfs[f] = pd.read_csv(path)
-
-    if not dfs:
-        print("[DataEDA] No CSVs found. Exiting.")
-        return
-
-    unique_artists = pd.concat([df["artist"].dropna() for df in dfs.values()]).unique()
-    print(f"[DataEDA] Fetching Last.fm info for {len(unique_artists)} unique artists...")
-
-    artist_cache = {}
-
-    def fetch_artist_info(artist_name):
-        if artist_name in artist_cache:
-            return artist_cache[artist_name]
-
-        url = f"http://ws.audioscrobbler.com/2.0/?method=artist.getInfo&artist={artist_name}&api_key={lastfm_api_key}&format=xml"
-        for attempt in range(retry_count):
-            try:
-                res = requests.get(url, timeout=10)
-                res.raise_for_status()
-                root = ET.fromstring(res.text)
-                genres = [t.find("name").text for t in root.findall(".//tags/tag")][:3] if root.find(".//tags") else []
-                listeners = int(root.find(".//stats/listeners").text) if root.find(".//stats/listeners") is not None else 0
-                artist_cache[artist_name] = (genres, listeners)
-                print(f"[DataEDA] Artist: {artist_name} | Genres: {genres} | Playcount: {listeners}")
-                return genres, listeners
-            except Exception:
-                time.sleep(backoff * (attempt + 1))
-        artist_cache[artist_name] = ([], 0)
-        return [], 0
-
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        list(executor.map(fetch_artist_info, unique_artists))
-
-    for f, df in dfs.items():
-        df["genres"] = df["artist"].map(lambda a: artist_cache.get(a, ([], 0))[0])
-        df["playcount"] = df["artist"].map(lambda a: artist_cache.get(a, ([], 0))[1])
-        out_path = os.path.join(datasets_dir, f)
-        df.to_csv(out_path, index=False)
-        print(f"[DataEDA] Saved enriched {f} ({len(df)} rows)")
-
+def fetch_top_tracks(access_token, on_artists=None):
+    print("[DataEDA] Fetching top tracks from Spotify...")
+    return fetch_listening_tracks(access_token, f"{SPOTIFY_API}/me/top/tracks?limit=50",
+                                  "Top Tracks", on_artists)
 
-def enrich_top_recent_with_similar_songs(lastfm_api_key, max_workers=8):
 
-    user_id = session.get("user_info").get("id")
-    datasets_dir = os.path.join("temp", user_id, "datasets")
-    csv_files = ["top_tracks.csv", "recent_tracks.csv"]
+def fetch_recent_tracks(access_token, on_artists=None):
+    print("[DataEDA] Fetching recently played tracks from Spotify...")
+    return fetch_listening_tracks(access_token, f"{SPOTIFY_API}/me/player/recently-played?limit=50",
+                                  "Recent Tracks", on_artists)
+
+
+class ArtistEnricher:
+    """Resolve genres, Last.fm listeners, Spotify followers and popularity for artists as they are discovered.
+
+    submit() can be called from any thread while Spotify is still being
+    paged. Artists are deduplicated on the fly and served from the shared
+    artist cache where possible. With the "spotify" source the rest are
+    resolved 50 at a time through Spotify's /v1/artists using the artist ids
+    the fetchers collected, and Last.fm artist.getInfo is only called for
+    artists without an id or without Spotify genres. Lookups run in the
+    background; results() waits for them.
+
+    Results are cached per source, as the "spotify" source leaves Last.fm
+    listeners unknown for most artists and "lastfm" never has followers.
+    """
+
+    def __init__(self, lastfm_api_key, access_token=None, source=ARTIST_INFO_SOURCE):
+        self.lastfm_api_key = lastfm_api_key
+        self.use_spotify = source == "spotify" and access_token is not None
+        self.headers = {"Authorization": f"Bearer {access_token}"}
+        self.shared_cache = get_artist_cache("spotify" if self.use_spotify else "lastfm")
+        self.spotify_executor = client.executor_for(SPOTIFY_API)
+        self.lastfm_executor = client.executor_for(LASTFM_API)
+        self.artists = {}
+        self.fetched = {}
+        self.seen = set()
+        self.pending_ids = {}
+        self.futures = []
+        self.counts = {"cache": 0, "spotify": 0, "lastfm": 0}
+        self.lock = threading.Lock()
+
+    def submit(self, artists):
+        """Queue (artist name, Spotify artist id) pairs; the id may be missing."""
+        new = {}
+        with self.lock:
+            for artist_name, artist_id in artists:
+                if artist_name and artist_name not in self.seen:
+                    self.seen.add(artist_name)
+                    new[artist_name] = artist_id if isinstance(artist_id, str) else None
+        if not new:
+            return
+
+        cached = self.shared_cache.get_many(normalize_key(a) for a in new)
+        batches, lastfm = [], []
+        with self.lock:
+            for artist_name, artist_id in new.items():
+                hit = cached.get(normalize_key(artist_name))
+                if hit is not None:
+                    self.artists[artist_name] = hit
+                    self.counts["cache"] += 1
+                elif self.use_spotify and artist_id:
+                    self.pending_ids[artist_id] = artist_name
+                    if len(self.pending_ids) == SPOTIFY_ARTISTS_BATCH:
+                        batches.append(self.pending_ids)
+                        self.pending_ids = {}
+                else:
+                    lastfm.append(artist_name)
+        for batch in batches:
+            self._submit(self.spotify_executor, self._fetch_spotify, batch)
+        for artist_name in lastfm:
+            self._submit(self.lastfm_executor, self._fetch_lastfm, artist_name)
+
+    def _submit(self, executor, fn, *args):
+        future = executor.submit(fn, *args)
+        with self.lock:
+            self.futures.append(future)
+
+    def _resolved(self, artist_name, info, source):
+        self.artists[artist_name] = info
+        self.fetched[normalize_key(artist_name)] = info
+        with self.lock:
+            self.counts[source] += 1
+
+    def _fetch_spotify(self, batch):
+        """Resolve up to 50 {artist id: name} entries; hand the rest to Last.fm."""
+        found = []
+        try:
+            res = client.get(f"{SPOTIFY_API}/artists", params={"ids": ",".join(batch)}, headers=self.headers)
+            res.raise_for_status()
+            found = [a for a in res.json().get("artists", []) if a]
+        except Exception as e:
+            print(f"[DataEDA] Spotify artist lookup failed for {len(batch)} artists, using Last.fm: {e}")
+
+        spotify_info = {}
+        for a in found:
+            artist_name = batch.get(a.get("id"))
+            if artist_name is None:
+                continue
+            spotify_info[artist_name] = {"followers": (a.get("followers") or {}).get("total"),
+                                         "popularity": a.get("popularity")}
+            genres = (a.get("genres") or [])[:3]
+            if genres:
+                self._resolved(artist_name, {"genres": genres, "listeners": None,
+                                             **spotify_info[artist_name]}, "spotify")
+        for artist_name in batch.values():
+            if artist_name not in self.artists:
+                info = spotify_info.get(artist_name, {})
+                self._submit(self.lastfm_executor, self._fetch_lastfm, artist_name,
+                             info.get("followers"), info.get("popularity"))
+
+    def _fetch_lastfm(self, artist_name, followers=None, popularity=None):
+        params = {"method": "artist.getInfo", "artist": artist_name, "api_key": self.lastfm_api_key, "format": "xml"}
+        try:
+            res = client.get(LASTFM_API, params=params, timeout=10)
+            res.raise_for_status()
+            root = ET.fromstring(res.text)
+            if root.get("status") == "failed":
+                raise ValueError(root.findtext("error", "Last.fm error"))
+            genres = [t.find("name").text for t in root.findall(".//tags/tag")][:3] if root.find(".//tags") else []
+            listeners = int(root.find(".//stats/listeners").text) if root.find(".//stats/listeners") is not None else 0
+            self._resolved(artist_name, {"genres": genres, "listeners": listeners, "followers": followers,
+                                         "popularity": popularity}, "lastfm")
+            print(f"[DataEDA] Artist: {artist_name} | Genres: {genres} | Listeners: {listeners}")
+        except Exception as e:
+            print(f"[DataEDA] Failed to fetch Last.fm info for {artist_name}: {e}")
+            self.artists[artist_name] = {"genres": [], "listeners": None, "followers": followers,
+                                         "popularity": popularity}
+
+    def results(self, progress=None):
+        """Wait for every lookup and return {artist: {"genres", "listeners", "followers", "popularity"}}."""
+        with self.lock:
+            batch, self.pending_ids = self.pending_ids, {}
+        if batch:
+            self._submit(self.spotify_executor, self._fetch_spotify, batch)
+
+        # Spotify batches can queue Last.fm fallbacks while we wait, so keep
+        # going until a pass finds nothing outstanding.
+        while True:
+            with self.lock:
+                futures = list(self.futures)
+            pending = [f for f in futures if not f.done()]
+            if not pending:
+                break
+            for done, _ in enumerate(as_completed(pending), start=len(futures) - len(pending) + 1):
+                if progress:
+                    progress("artists", done, len(futures))
+
+        if self.fetched:
+            self.shared_cache.set_many(self.fetched)
+        print(f"[DataEDA] Resolved {len(self.seen)} artists: {self.counts['cache']} from cache, "
+              f"{self.counts['spotify']} from Spotify, {self.counts['lastfm']} from Last.fm")
+        return self.artists
+
+
+def apply_artist_info(df, artists):
+    empty = {"genres": []}
+    info = [artists.get(a, empty) for a in df["artist"]]
+    df["genres"] = [i["genres"] for i in info]
+    df["playcount"] = pd.array([i.get("listeners") for i in info], dtype="Int64")
+    df["followers"] = pd.array([i.get("followers") for i in info], dtype="Int64")
+    df["popularity"] = pd.array([i.get("popularity") for i in info], dtype="Int32")
+    return df
+
+
+def enrich_top_recent_with_similar_songs(datasets, lastfm_api_key, progress=None):
+    """Add a similar_songs column to the top_tracks and recent_tracks frames in datasets."""
     artist_song_cache = {}
+    # Lookups made for the current dataset, saved to the shared cache after it.
+    fetched, failed_lookups = {}, {}
+
+    shared_cache = get_similar_cache()
+    executor = client.executor_for(LASTFM_API)
 
     def fetch_similar_songs(artist_name, track_name):
-        key = f"{artist_name}::{track_name}"
+        key = normalize_key(artist_name, track_name)
         if key in artist_song_cache:
             return artist_song_cache[key]
 
         similar = []
+        failed = False
         try:
-            url = f"http://ws.audioscrobbler.com/2.0/?method=track.getsimilar&artist={artist_name}&track={track_name}&api_key={lastfm_api_key}&format=json&limit=3"
-            res = requests.get(url, timeout=10)
+            params = {"method": "track.getsimilar", "artist": artist_name, "track": track_name,
+                      "api_key": lastfm_api_key, "format": "json", "limit": 3}
+            res = client.get(LASTFM_API, params=params, timeout=10)
             res.raise_for_status()
             tracks = res.json().get("similartracks", {}).get("track", [])[:3]
-            similar = [{t.get("name", "Unknown"): t.get("artist", {}).get("name", "Unknown")} for t in tracks]
+            similar = [{"name": t.get("name", "Unknown"), "artist": t.get("artist", {}).get("name", "Unknown")}
+                       for t in tracks]
         except Exception as e:
+            failed = True
             print(f"[DataEDA] Failed to fetch similar songs for {track_name} by {artist_name}: {e}")
 
         artist_song_cache[key] = similar
+        if failed or not similar:
+            failed_lookups[key] = similar
+        else:
+            fetched[key] = similar
         print(f"[DataEDA] Track: {track_name} by {artist_name} | Similar Songs: {similar}")
         return similar
 
-    for csv_file in csv_files:
-        path = os.path.join(datasets_dir, csv_file)
-        if not os.path.exists(path):
-            print(f"[DataEDA] CSV not found: {path}, skipping")
+    for name in ["top_tracks", "recent_tracks"]:
+        df = datasets.get(name)
+        if df is None:
+            print(f"[DataEDA] Dataset not found: {name}, skipping")
             continue
 
-        df = pd.read_csv(path)
         if df.empty:
-            print(f"[DataEDA] {csv_file} is empty, skipping")
+            print(f"[DataEDA] {name} is empty, skipping")
             continue
 
         df["similar_songs"] = [[] for _ in range(len(df))]
 
         tasks = [(i, row["artist"], row["name"]) for i, row in df.iterrows() if row.get("artist") and row.get("name")]
 
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_index = {executor.submit(fetch_similar_songs, artist, track): i for i, artist, track in tasks}
-            for future in as_completed(future_to_index):
-                i = future_to_index[future]
-                try:
-                    df.at[i, "similar_songs"] = future.result()
-                except Exception:
-                    df.at[i, "similar_songs"] = []
-
-        df.to_csv(path, index=False)
-        print(f"[DataEDA] Enriched similar songs via Last.fm in {csv_file} ({len(df)} rows)")
\ No newline at end of file
+        keys = [normalize_key(artist, track) for _, artist, track in tasks]
+        artist_song_cache.update(shared_cache.get_many(k for k in keys if k not in artist_song_cache))
+
+        future_to_index = {executor.submit(fetch_similar_songs, artist, track): i for i, artist, track in tasks}
+        for done, future in enumerate(as_completed(future_to_index), start=1):
+            i = future_to_index[future]
+            try:
+                df.at[i, "similar_songs"] = future.result()
+            except Exception:
+                df.at[i, "similar_songs"] = []
+            if progress:
+                progress("similar_songs", done, len(tasks))
+
+        if fetched:
+            shared_cache.set_many(fetched)
+        if failed_lookups:
+            shared_cache.set_many(failed_lookups, negative=True)
+        fetched.clear()
+        failed_lookups.clear()
+
+        print(f"[DataEDA] Enriched similar songs via Last.fm in {name} ({len(df)} rows)")
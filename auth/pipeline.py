@@ -0,0 +1,137 @@
+import os
+import time
+from utils.jobs import job_progress
+from utils.plotting import generate_all_user_plots, user_plots_dir
+from utils.store import write_dataset, read_dataset, dataset_path, datasets_dir
+from utils.aggregates import build_aggregates, table_hashes, aggregates_path
+from utils.manifest import StageManifest
+from utils.memory import PeakMemory, record_setup_memory
+from .fetch import (fetch_user_tracks,
+                    write_user_tracks,
+                    playlist_fingerprint,
+                    dataset_artists,
+                    stored_user_tracks,
+                    save_user_info,
+                    fetch_top_tracks,
+                    fetch_recent_tracks,
+                    ArtistEnricher,
+                    apply_artist_info,
+                    enrich_top_recent_with_similar_songs,
+                    ARTIST_INFO_SOURCE,
+                    ARTIST_FIELDS,
+                    USER_SONGS_RAW)
+
+# Data fetched longer ago than this is refreshed when the user next sets up.
+DATA_MAX_AGE_HOURS = float(os.environ.get("PLAYLISTR_DATA_MAX_AGE_HOURS", 24))
+
+# Datasets written by the enrich stages, and the raw dataset each is made from.
+ENRICHED_DATASETS = {"user_songs": USER_SONGS_RAW,
+                     "top_tracks": "top_tracks_raw",
+                     "recent_tracks": "recent_tracks_raw"}
+
+
+def data_is_stale(user_id):
+    """True if the user's data was fetched more than DATA_MAX_AGE_HOURS ago."""
+    fetch = StageManifest(user_id).get("fetch")
+    return bool(fetch) and time.time() - fetch.get("fetched_at", 0) > DATA_MAX_AGE_HOURS * 3600
+
+
+def run_user_setup(job_id, user_info, access_token, lastfm_api_key, refresh=False):
+    """Fetch, enrich and plot a user's data. Runs on the job worker pool.
+
+    Every stage is recorded in the user's StageManifest and skipped while
+    its inputs and outputs are unchanged, so an interrupted setup resumes
+    at the first stage that did not complete. With refresh=True the data is
+    refetched from Spotify (incrementally) and only the stages downstream
+    of what actually changed are rerun.
+    """
+    progress = job_progress(job_id)
+    user_id = user_info.get("id")
+    os.makedirs(user_plots_dir(user_id), exist_ok=True)
+
+    with PeakMemory() as memory:
+        ingest = _run_setup_stages(StageManifest(user_id), user_info, access_token,
+                                   lastfm_api_key, refresh, progress)
+
+    report = memory.summary()
+    if ingest:
+        report += f", ingest buffer peak {ingest.peak_bytes / (1024 * 1024):.1f} MB"
+    print(f"[DataEDA] Setup memory for user {user_id}: {report}")
+    record_setup_memory(memory)
+
+
+def _run_setup_stages(manifest, user_info, access_token, lastfm_api_key, refresh, progress):
+    """Run the fetch, enrich, aggregate and plot stages; returns the playlist TrackStream if tracks were fetched."""
+    user_id = user_info.get("id")
+    ingest = enricher = None
+
+    # Spotify's state is not known without asking it, so fetching only
+    # counts as done until the next refresh.
+    if refresh or not manifest.is_current("fetch", {}):
+        print(f"[DataEDA] Fetching datasets for user {user_id}")
+        # Artists found while paging Spotify are looked up right away.
+        # Playlist tracks are streamed to disk in chunks.
+        enricher = ArtistEnricher(lastfm_api_key, access_token)
+        progress("playlists")
+        ingest = fetch_user_tracks(user_info, access_token, progress=progress,
+                                   incremental=stored_user_tracks(user_id) is not None,
+                                   on_artists=enricher.submit)
+        save_user_info(user_info)
+        progress("top_recent")
+        write_dataset(user_id, "top_tracks_raw", fetch_top_tracks(access_token, on_artists=enricher.submit))
+        write_dataset(user_id, "recent_tracks_raw", fetch_recent_tracks(access_token, on_artists=enricher.submit))
+        manifest.record("fetch", {}, [dataset_path(user_id, raw) for raw in ENRICHED_DATASETS.values()]
+                        + [os.path.join(datasets_dir(user_id), "user_info.json")],
+                        fetched_at=time.time())
+    else:
+        print(f"[DataEDA] Datasets already fetched for user {user_id}, skipping fetch")
+
+    fetched = manifest.outputs("fetch")
+    artist_info = {"source": ARTIST_INFO_SOURCE, "fields": ARTIST_FIELDS}
+    stage_inputs = {
+        "user_songs": {"playlists": playlist_fingerprint(user_id), **artist_info},
+        "top_tracks": {"raw": fetched[os.path.join("datasets", "top_tracks_raw.parquet")], **artist_info},
+        "recent_tracks": {"raw": fetched[os.path.join("datasets", "recent_tracks_raw.parquet")], **artist_info},
+    }
+    stale = [name for name in ENRICHED_DATASETS if not manifest.is_current(f"enrich:{name}", stage_inputs[name])]
+    if stale:
+        print(f"[DataEDA] Enriching {', '.join(stale)} for user {user_id}")
+        if enricher is None:
+            # Resuming after the fetch: look up the artists of what is left to enrich.
+            enricher = ArtistEnricher(lastfm_api_key, access_token)
+            for name in stale:
+                enricher.submit(dataset_artists(user_id, ENRICHED_DATASETS[name]))
+        progress("artists")
+        artists = enricher.results(progress=progress)
+
+        datasets = {name: read_dataset(user_id, ENRICHED_DATASETS[name])
+                    for name in stale if name != "user_songs"}
+        if datasets:
+            progress("similar_songs")
+            enrich_top_recent_with_similar_songs(datasets, lastfm_api_key, progress=progress)
+        for name in stale:
+            if name == "user_songs":
+                write_user_tracks(user_id, artists)
+            else:
+                path = write_dataset(user_id, name, apply_artist_info(datasets[name], artists))
+                print(f"[DataEDA] Saved {len(datasets[name])} rows to {path}")
+            manifest.record(f"enrich:{name}", stage_inputs[name], [dataset_path(user_id, name)])
+    else:
+        print(f"[DataEDA] Datasets unchanged for user {user_id}, skipping enrichment")
+        if enricher is not None:
+            # The fetch already queued lookups for the artists it found;
+            # wait for them so their results are saved to the artist cache.
+            enricher.results()
+
+    aggregate_inputs = {name: manifest.outputs(f"enrich:{name}") for name in ENRICHED_DATASETS}
+    if not manifest.is_current("aggregate", aggregate_inputs):
+        aggregates = build_aggregates(user_id)
+        manifest.record("aggregate", aggregate_inputs, [aggregates_path(user_id)],
+                        tables=table_hashes(aggregates))
+    else:
+        print(f"[DataEDA] Aggregates unchanged for user {user_id}, skipping aggregation")
+
+    progress("plots")
+    generate_all_user_plots(user_id, progress=progress, manifest=manifest)
+    print(f"[DataEDA] Setup complete for user {user_id}")
+    return ingest
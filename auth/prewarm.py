@@ -0,0 +1,126 @@
+import os
+import json
+import time
+import fcntl
+import threading
+from datetime import datetime
+import requests
+from utils.files import TEMP_DIR
+from utils.store import datasets_dir
+from utils.jobs import submit_job, get_job
+from .pipeline import run_user_setup
+from .tokens import prewarm_candidates, update_refresh_token, mark_prewarmed, forget_user
+
+SPOTIPY_CLIENT_ID = os.environ.get("SPOTIPY_CLIENT_ID")
+LASTFM_API_KEY = os.environ.get("LASTFM_API_KEY")
+
+PREWARM_ENABLED = os.environ.get("PLAYLISTR_PREWARM", "1") == "1"
+# Local hours, as "start-end", during which returning users' data is refreshed.
+PREWARM_HOURS = tuple(int(h) for h in os.environ.get("PLAYLISTR_PREWARM_HOURS", "3-6").split("-"))
+# Users who logged in within this many days are kept warm.
+PREWARM_ACTIVE_DAYS = float(os.environ.get("PLAYLISTR_PREWARM_ACTIVE_DAYS", 14))
+# A user is refreshed at most once per this many hours.
+PREWARM_EVERY_HOURS = float(os.environ.get("PLAYLISTR_PREWARM_EVERY_HOURS", 20))
+PREWARM_CHECK_SECONDS = 600
+PREWARM_JOB_TIMEOUT = 1800
+PREWARM_LOCK = os.path.join(TEMP_DIR, "prewarm.lock")
+
+_scheduler = None
+
+
+def in_prewarm_window(now=None):
+    start, end = PREWARM_HOURS
+    hour = (now or datetime.now()).hour
+    return start <= hour < end if start <= end else hour >= start or hour < end
+
+
+def refresh_access_token(user_id, refresh_token):
+    """Exchange a stored refresh token for a new access token, keeping a rotated refresh token."""
+    res = requests.post(
+        "https://accounts.spotify.com/api/token",
+        data={"grant_type": "refresh_token", "refresh_token": refresh_token, "client_id": SPOTIPY_CLIENT_ID},
+        timeout=10,
+    )
+    if res.status_code == 400:
+        # invalid_grant: the user revoked access, or the token expired.
+        forget_user(user_id)
+        print(f"[Prewarm] Refresh token for user {user_id} is no longer valid, forgetting it")
+        return None
+    res.raise_for_status()
+    token = res.json()
+    if token.get("refresh_token") and token["refresh_token"] != refresh_token:
+        update_refresh_token(user_id, token["refresh_token"])
+    return token.get("access_token")
+
+
+def prewarm_user(user_id, refresh_token):
+    """Run an incremental refresh of user_id's data and wait for it; returns the job's status."""
+    user_info_file = os.path.join(datasets_dir(user_id), "user_info.json")
+    if not os.path.exists(user_info_file):
+        # Never set up, or logged out since: there is nothing to keep warm.
+        forget_user(user_id)
+        return None
+    with open(user_info_file, "r") as f:
+        user_info = json.load(f)
+
+    access_token = refresh_access_token(user_id, refresh_token)
+    if not access_token:
+        return None
+
+    job = submit_job(user_id, run_user_setup, user_info, access_token, LASTFM_API_KEY, refresh=True)
+    # One user at a time, so the refreshes never queue ahead of more than
+    # one interactive setup on the shared job workers.
+    deadline = time.time() + PREWARM_JOB_TIMEOUT
+    while job["status"] in ("queued", "running") and time.time() < deadline:
+        time.sleep(2)
+        job = get_job(job["id"])
+    mark_prewarmed(user_id)
+    return job["status"]
+
+
+def prewarm_active_users():
+    """Refresh every recently active user that is due, for as long as the window lasts."""
+    now = time.time()
+    users = prewarm_candidates(active_since=now - PREWARM_ACTIVE_DAYS * 86400,
+                               prewarmed_before=now - PREWARM_EVERY_HOURS * 3600)
+    for user in users:
+        if not in_prewarm_window():
+            break
+        start = time.perf_counter()
+        try:
+            status = prewarm_user(user["user_id"], user["refresh_token"])
+        except Exception as e:
+            status = f"error: {e}"
+        print(f"[Prewarm] User {user['user_id']}: {status} in {time.perf_counter() - start:.1f}s")
+
+
+def _run_scheduler():
+    # Only one process per deployment runs the refreshes: the others find
+    # the lock taken and take over if that process goes away.
+    os.makedirs(os.path.dirname(PREWARM_LOCK), exist_ok=True)
+    lock = open(PREWARM_LOCK, "w")
+    locked = False
+    while True:
+        if not locked:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                locked = True
+                print(f"[Prewarm] Scheduler running in process {os.getpid()}, "
+                      f"hours {PREWARM_HOURS[0]}-{PREWARM_HOURS[1]}")
+            except BlockingIOError:
+                pass
+        if locked and in_prewarm_window():
+            try:
+                prewarm_active_users()
+            except Exception as e:
+                print(f"[Prewarm] Run failed: {e}")
+        time.sleep(PREWARM_CHECK_SECONDS)
+
+
+def start_prewarm_scheduler():
+    """Start the background pre-warm scheduler thread, once per process."""
+    global _scheduler
+    if not PREWARM_ENABLED or _scheduler is not None:
+        return
+    _scheduler = threading.Thread(target=_run_scheduler, name="playlistr-prewarm", daemon=True)
+    _scheduler.start()
@@ -6,19 +6,19 @@ import shutil
 import os
 import traceback
 import json
-from flask import Blueprint, redirect, request, session, render_template
-from utils.plotting import generate_all_user_plots 
-from .fetch import (fetch_user_info,
-                    fetch_save_user_tracks,
-                    save_user_info,
-                    fetch_save_top_tracks,
-                    fetch_save_recent_tracks,
-                    enrich_songs_with_lastfm,
-                    enrich_top_recent_with_similar_songs)
+from flask import Blueprint, redirect, request, session, render_template, jsonify, Response
+from utils.files import user_dir
+from utils.store import datasets_dir
+from utils.jobs import submit_job, get_latest_job, get_job_events
+from .fetch import fetch_user_info
+from .pipeline import run_user_setup, data_is_stale
+from .tokens import save_refresh_token, forget_user
 
 SPOTIPY_CLIENT_ID = os.environ.get("SPOTIPY_CLIENT_ID")
 REDIRECT_URI = os.environ.get("REDIRECT_URI")
 LASTFM_API_KEY = os.environ.get("LASTFM_API_KEY")
+# Delay before an EventSource reconnects to /setup/events for new events.
+EVENTS_RETRY_MS = 1000
 SCOPES = "user-read-private user-read-email user-top-read user-read-recently-played"
 
 auth_bp = Blueprint('auth', __name__)
@@ -59,8 +59,10 @@ def set_access_token():
         },
     )
     token_res.raise_for_status()
-    access_token = token_res.json().get("access_token")
-    session['access_token'] = access_token
+    token = token_res.json()
+    session['access_token'] = token.get("access_token")
+    # The refresh token is kept server-side only, for background refreshes.
+    return token.get("refresh_token")
 
 
 @auth_bp.route("/logout")
@@ -69,64 +71,111 @@ def logout():
     user_id = user_info.get("id")
     if user_id:
         try:
-            user_dir = os.path.join("temp", user_id)
-            shutil.rmtree(user_dir)
-            print(f"[Auth] Deleted user folder: {user_dir}")
+            shutil.rmtree(user_dir(user_id))
+            print(f"[Auth] Deleted user folder: {user_dir(user_id)}")
         except Exception as e:
             print(f"[Auth] Failed to delete user folder: {e}")
+        forget_user(user_id)
     session.clear()
+    session.regenerate()
     return redirect("/")
 
 @auth_bp.route("/callback")
 def callback():
     try:
-        set_access_token()
+        refresh_token = set_access_token()
         fetch_user_info()
+        if refresh_token:
+            save_refresh_token(session["user_info"]["id"], refresh_token)
     except Exception as e:
         traceback.print_exc()
         return f"Spotify authentication failed: {e}", 500
 
+    # A session id issued before the login, possibly planted by someone
+    # else, must not carry the authenticated session.
+    session.regenerate()
+
     return render_template("loading.html")
 
+@auth_bp.route("/refresh")
+def refresh():
+    if not session.get("user_info"):
+        return redirect("/login")
+    return render_template("loading.html", refresh=True)
+
 @auth_bp.route("/setup")
 def setup():
+    user_info = session.get("user_info")
+    access_token = session.get("access_token")
+    if not user_info or not access_token:
+        return jsonify({"error": "User not logged in"}), 403
+
+    # Returning users are normally kept current by the pre-warm scheduler;
+    # data it has not refreshed in a while is synced now.
+    refresh = request.args.get("refresh") == "1" or data_is_stale(user_info["id"])
     try:
-        user_info = session.get("user_info")
-        user_id = user_info.get("id")
-        user_dir = os.path.join("temp", user_id)
-        datasets_dir = os.path.join(user_dir, "datasets")
-        plots_dir = os.path.join(user_dir, "plots")
-
-        os.makedirs(datasets_dir, exist_ok=True)
-        os.makedirs(plots_dir, exist_ok=True)
-
-        if not os.listdir(datasets_dir):
-            print(f"[DataEDA] Datasets folder empty for user {user_id}, generating CSVs and JSON")
-            fetch_save_user_tracks()
-            save_user_info()
-            fetch_save_top_tracks()
-            fetch_save_recent_tracks()
-            enrich_songs_with_lastfm(lastfm_api_key=LASTFM_API_KEY)
-            enrich_top_recent_with_similar_songs(lastfm_api_key=LASTFM_API_KEY)
-            print(f"[DataEDA] Datasets created for user {user_id}")
-        else:
-            print(f"[DataEDA] Datasets already exist for user {user_id}, skipping generation")
-
-        if not os.listdir(plots_dir):
-            print(f"[DataEDA] Plots folder empty for user {user_id}, generating plots")
-            generate_all_user_plots()
-            print(f"[DataEDA] Plots created for user {user_id}")
-        else:
-            print(f"[DataEDA] Plots already exist for user {user_id}, skipping generation")
-
-        user_info_file = os.path.join(datasets_dir, "user_info.json")
-        if os.path.exists(user_info_file):
-            with open(user_info_file, "r") as f:
-                session["user_info"] = json.load(f)
-
+        job = submit_job(user_info["id"], run_user_setup, dict(user_info), access_token, LASTFM_API_KEY, refresh=refresh)
     except Exception as e:
-        print(f"[Setup] Error during setup: {e}")
+        print(f"[Setup] Error queuing setup: {e}")
         traceback.print_exc()
-        return f"Setup failed: {e}", 500
+        return jsonify({"error": f"Setup failed: {e}"}), 500
+
+    return jsonify(job), 202
+
+@auth_bp.route("/setup/status")
+def setup_status():
+    user_info = session.get("user_info")
+    if not user_info:
+        return jsonify({"error": "User not logged in"}), 403
+
+    job = get_latest_job(user_info["id"])
+    if not job:
+        return jsonify({"error": "No setup job found"}), 404
 
-    return redirect("/")
\ No newline at end of file
+    if job["status"] == "done":
+        load_saved_user_info(user_info["id"])
+
+    return jsonify(job)
+
+@auth_bp.route("/setup/events")
+def setup_events():
+    """Server-Sent Events stream of the latest setup job's progress.
+
+    Each response sends the events recorded since Last-Event-ID and then
+    closes; the browser's EventSource reconnects after ``retry`` ms. No
+    request is held open while the job runs, so connected clients do not tie
+    up server threads. A final "end" event carries the job status.
+    """
+    user_info = session.get("user_info")
+    if not user_info:
+        return jsonify({"error": "User not logged in"}), 403
+
+    job = get_latest_job(user_info["id"])
+    if not job:
+        return jsonify({"error": "No setup job found"}), 404
+
+    try:
+        last_event_id = int(request.headers.get("Last-Event-ID") or request.args.get("after") or 0)
+    except ValueError:
+        last_event_id = 0
+
+    lines = [f"retry: {EVENTS_RETRY_MS}\n"]
+    events = get_job_events(job["id"], after_id=last_event_id)
+    for event in events:
+        lines.append(f"id: {event['id']}\nevent: progress\ndata: {json.dumps(event)}\n")
+
+    # The job row is read before the events, so once it is finished every
+    # event it recorded is in ``events`` or was sent earlier.
+    if job["status"] in ("done", "failed") and (not events or events[-1]["stage"] in ("done", "failed")):
+        if job["status"] == "done":
+            load_saved_user_info(user_info["id"])
+        lines.append(f"event: end\ndata: {json.dumps(job)}\n")
+
+    return Response("\n".join(lines) + "\n", mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def load_saved_user_info(user_id):
+    user_info_file = os.path.join(datasets_dir(user_id), "user_info.json")
+    if os.path.exists(user_info_file):
+        with open(user_info_file, "r") as f:
+            session["user_info"] = json.load(f)
@@ -0,0 +1,78 @@
+import os
+import time
+import sqlite3
+from utils.files import TEMP_DIR
+
+TOKENS_DB = os.path.join(TEMP_DIR, "tokens.db")
+
+
+def _connect():
+    os.makedirs(os.path.dirname(TOKENS_DB), exist_ok=True)
+    created = not os.path.exists(TOKENS_DB)
+    conn = sqlite3.connect(TOKENS_DB, timeout=30, isolation_level=None)
+    if created:
+        # Refresh tokens grant access to the user's Spotify account.
+        os.chmod(TOKENS_DB, 0o600)
+    conn.row_factory = sqlite3.Row
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_tokens (
+            user_id TEXT PRIMARY KEY,
+            refresh_token TEXT,
+            last_active REAL NOT NULL,
+            last_prewarm REAL
+        )
+    """)
+    return conn
+
+
+def save_refresh_token(user_id, refresh_token):
+    """Store user_id's Spotify refresh token and mark the user active now."""
+    conn = _connect()
+    try:
+        conn.execute(
+            "INSERT INTO user_tokens (user_id, refresh_token, last_active) VALUES (?, ?, ?) "
+            "ON CONFLICT (user_id) DO UPDATE SET refresh_token = excluded.refresh_token, "
+            "last_active = excluded.last_active",
+            (user_id, refresh_token, time.time()),
+        )
+    finally:
+        conn.close()
+
+
+def update_refresh_token(user_id, refresh_token):
+    """Replace a stored refresh token, e.g. after Spotify rotated it, without touching activity."""
+    conn = _connect()
+    try:
+        conn.execute("UPDATE user_tokens SET refresh_token = ? WHERE user_id = ?", (refresh_token, user_id))
+    finally:
+        conn.close()
+
+
+def mark_prewarmed(user_id):
+    conn = _connect()
+    try:
+        conn.execute("UPDATE user_tokens SET last_prewarm = ? WHERE user_id = ?", (time.time(), user_id))
+    finally:
+        conn.close()
+
+
+def forget_user(user_id):
+    conn = _connect()
+    try:
+        conn.execute("DELETE FROM user_tokens WHERE user_id = ?", (user_id,))
+    finally:
+        conn.close()
+
+
+def prewarm_candidates(active_since, prewarmed_before):
+    """Users active since active_since and not prewarmed since prewarmed_before, least recently prewarmed first."""
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            "SELECT * FROM user_tokens WHERE refresh_token IS NOT NULL AND last_active >= ? "
+            "AND (last_prewarm IS NULL OR last_prewarm < ?) ORDER BY COALESCE(last_prewarm, 0), last_active DESC",
+            (active_since, prewarmed_before),
+        ).fetchall()
+    finally:
+        conn.close()
+    return [dict(row) for row in rows]
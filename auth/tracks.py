@@ -0,0 +1,162 @@
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+
+# Per-track columns parsed from Spotify track objects, in dataset order.
+TRACK_FIELDS = ("name", "name_url", "artist", "artist_id", "artist_url", "album", "album_url", "year", "album_art")
+
+
+class TrackColumns:
+    """Column-wise buffer of parsed Spotify tracks for one playlist or list.
+
+    Each track is appended field by field into per-column lists instead of
+    being built as a dict per row, and the playlist fields that are the same
+    for every row are stored once and only expanded in to_frame().
+    """
+
+    __slots__ = ("playlist", "playlist_id", "snapshot_id", "columns")
+
+    def __init__(self, playlist, playlist_id=None, snapshot_id=None):
+        self.playlist = playlist
+        self.playlist_id = playlist_id
+        self.snapshot_id = snapshot_id
+        self.columns = {field: [] for field in TRACK_FIELDS}
+
+    def __len__(self):
+        return len(self.columns["name"])
+
+    def artist_refs(self):
+        """Return the (artist name, Spotify artist id) pair of every row."""
+        return list(zip(self.columns["artist"], self.columns["artist_id"]))
+
+    def add_items(self, items):
+        """Append the tracks of a page of Spotify items; returns how many were added.
+
+        Accepts bare track objects (top tracks) as well as items wrapping one
+        under "track" (playlist and recently played items). Items without a
+        track, such as removed or local entries, are skipped.
+        """
+        c = self.columns
+        name, name_url = c["name"].append, c["name_url"].append
+        artist, artist_id, artist_url = c["artist"].append, c["artist_id"].append, c["artist_url"].append
+        album_name, album_url = c["album"].append, c["album_url"].append
+        year, album_art = c["year"].append, c["album_art"].append
+        added = 0
+        for item in items:
+            t = item.get("track", item) if item else None
+            if not t:
+                continue
+            artists = t.get("artists") or [{}]
+            album = t.get("album") or {}
+            release_date = album.get("release_date") or "1900"
+            images = album.get("images") or [{}]
+
+            name(t.get("name", ""))
+            name_url((t.get("external_urls") or {}).get("spotify", ""))
+            artist(artists[0].get("name", ""))
+            artist_id(artists[0].get("id"))
+            artist_url((artists[0].get("external_urls") or {}).get("spotify", ""))
+            album_name(album.get("name", ""))
+            album_url((album.get("external_urls") or {}).get("spotify", ""))
+            year(int(release_date[:4]))
+            album_art(images[0].get("url", ""))
+            added += 1
+        return added
+
+    def nbytes(self):
+        """Approximate memory held by the buffered values."""
+        return sum(sys.getsizeof(column) + sum(map(sys.getsizeof, column)) for column in self.columns.values())
+
+    def to_frame(self):
+        n = len(self)
+        data = {"playlist": [self.playlist] * n, **self.columns}
+        if self.playlist_id is not None:
+            data["playlist_id"] = [self.playlist_id] * n
+            data["snapshot_id"] = [self.snapshot_id] * n
+        return pd.DataFrame(data)
+
+
+def tracks_frame(batches, with_playlist_ids=False):
+    """Concatenate TrackColumns batches into one frame with a stable column set."""
+    columns = ["playlist", *TRACK_FIELDS]
+    if with_playlist_ids:
+        columns += ["playlist_id", "snapshot_id"]
+    frames = [b.to_frame() for b in batches if len(b)]
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)[columns]
+
+
+class TrackStream:
+    """Collect TrackColumns pages from fetch threads and write them out in chunks.
+
+    Pages are buffered until chunk_rows rows or about max_bytes of values
+    are held, then written as one chunk through ``writer`` (a
+    utils.store.DatasetWriter). Memory for parsed rows is bounded by the
+    chunk rather than by the size of the library.
+
+    Chunks are converted and written on one thread of the stream's own:
+    Arrow allocations spread over the long-lived fetch threads were not
+    given back and grew the process with every chunk.
+    """
+
+    def __init__(self, writer, chunk_rows, max_bytes, with_playlist_ids=False):
+        self.writer = writer
+        self.chunk_rows = chunk_rows
+        self.max_bytes = max_bytes
+        self.with_playlist_ids = with_playlist_ids
+        self.batches = []
+        self.rows = 0
+        self.nbytes = 0
+        self.peak_bytes = 0
+        self.chunks = 0
+        self.error = None
+        self._lock = threading.Lock()
+        self._writer_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="playlistr-ingest")
+
+    def add(self, batch):
+        if not len(batch):
+            return
+        with self._lock:
+            self.batches.append(batch)
+            self.rows += len(batch)
+            self.nbytes += batch.nbytes()
+            self.peak_bytes = max(self.peak_bytes, self.nbytes)
+            if self.rows >= self.chunk_rows or self.nbytes >= self.max_bytes:
+                self._flush()
+
+    def write_frame(self, df):
+        """Write rows that are already a frame, after whatever is buffered."""
+        with self._lock:
+            self._flush()
+            if len(df):
+                self._write(lambda: df)
+
+    def flush(self):
+        """Write whatever is buffered; raises if any chunk failed to write."""
+        with self._lock:
+            self._flush()
+            if self.error:
+                raise self.error
+
+    def close(self):
+        self._writer_thread.shutdown()
+
+    def _flush(self):
+        if self.batches:
+            batches = self.batches
+            self._write(lambda: tracks_frame(batches, self.with_playlist_ids))
+        self.batches, self.rows, self.nbytes = [], 0, 0
+
+    def _write(self, make_frame):
+        # A failed chunk holds rows of several playlists, so it fails the
+        # whole stream rather than just the playlist whose page flushed it.
+        if self.error:
+            raise self.error
+        try:
+            self._writer_thread.submit(lambda: self.writer.write(make_frame())).result()
+        except Exception as e:
+            self.error = e
+            raise
+        self.chunks += 1
@@ -0,0 +1,67 @@
+"""Benchmark auth.client against the bare requests.get thread pool it replaced.
+
+The old fetchers called requests.get from an 8-thread pool, opening a new
+connection per call; auth.client keeps pooled keep-alive connections under
+a per-host limiter. Both fetch the same pages from a local mock upstream
+with a simulated per-connection handshake cost.
+
+    python -m bench.client [--requests 2000] [--latency-ms 20] [--connect-ms 30]
+"""
+import os
+import time
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+# Files the app writes go to a scratch directory instead of its temp/.
+os.environ.setdefault("PLAYLISTR_TEMP_DIR", tempfile.mkdtemp(prefix="playlistr-bench-"))
+
+from auth import client
+from bench.mock_upstream import MockUpstream, percentile
+
+WORKERS = 8
+HEADERS = {"Authorization": "Bearer bench"}
+
+
+def timed(get, url):
+    start = time.perf_counter()
+    res = get(url)
+    res.raise_for_status()
+    return time.perf_counter() - start
+
+
+def run(label, upstream, executor, get, n):
+    upstream.reset()
+    urls = [f"{upstream.url}/v1/playlists/bench/tracks?offset={i}" for i in range(n)]
+    start = time.perf_counter()
+    latencies = list(executor.map(lambda url: timed(get, url), urls))
+    seconds = time.perf_counter() - start
+    print(f"{label:<26} {n / seconds:8.1f} req/s   p50 {percentile(latencies, 0.5) * 1000:6.1f} ms   "
+          f"p95 {percentile(latencies, 0.95) * 1000:6.1f} ms   {upstream.connections:5d} connections")
+    return n / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--connect-ms", type=float, default=30)
+    args = parser.parse_args()
+
+    with MockUpstream(latency=args.latency_ms / 1000, connect_latency=args.connect_ms / 1000) as upstream:
+        # The mock is not rate limited; give it the same concurrency as Spotify.
+        client.HOST_LIMITS[upstream.host] = WORKERS
+        client.HOST_RATES[upstream.host] = 1e9
+        print(f"{args.requests} GETs, {args.latency_ms:.0f} ms response time, "
+              f"{args.connect_ms:.0f} ms per new connection, {WORKERS} workers")
+        with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+            before = run("requests.get + pool", upstream, pool,
+                         lambda url: requests.get(url, headers=HEADERS), args.requests)
+        after = run("auth.client", upstream, client.executor_for(upstream.url),
+                    lambda url: client.get(url, headers=HEADERS), args.requests)
+    print(f"speedup {after / before:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
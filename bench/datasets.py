@@ -0,0 +1,105 @@
+"""Benchmark the Parquet dataset store against the CSV round-trip it replaced.
+
+The CSV path wrote list columns as Python reprs and parsed them back with
+ast.literal_eval on every load; utils.store keeps them as native list
+columns and reads only the columns asked for. Both load a synthetic
+library of enriched playlist tracks.
+
+    python -m bench.datasets [--tracks 10000] [--repeat 5]
+"""
+import os
+import ast
+import time
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+# Files the app writes go to a scratch directory instead of its temp/.
+os.environ.setdefault("PLAYLISTR_TEMP_DIR", tempfile.mkdtemp(prefix="playlistr-bench-"))
+
+from utils.store import write_dataset, read_dataset, read_records, dataset_path, datasets_dir
+
+USER_ID = "bench"
+GENRES = [f"genre {i}" for i in range(300)]
+PLOT_COLUMNS = ["playlist", "name", "artist", "album", "year", "genres", "playcount"]
+
+
+def library(n, seed=0):
+    rng = np.random.default_rng(seed)
+    artists = rng.integers(0, max(1, n // 4), n)
+    return pd.DataFrame({
+        "playlist": [f"Playlist {i}" for i in rng.integers(0, 40, n)],
+        "name": [f"Track {i}" for i in range(n)],
+        "name_url": [f"https://open.spotify.com/track/{i:022d}" for i in range(n)],
+        "artist": [f"Artist {a}" for a in artists],
+        "artist_url": [f"https://open.spotify.com/artist/{a:022d}" for a in artists],
+        "album": [f"Album {a}" for a in rng.integers(0, max(1, n // 8), n)],
+        "album_url": [f"https://open.spotify.com/album/{i:022d}" for i in range(n)],
+        "year": rng.integers(1960, 2025, n),
+        "album_art": [f"https://i.scdn.co/image/{i:040d}" for i in range(n)],
+        "genres": [[str(g) for g in rng.choice(GENRES, rng.integers(0, 4), replace=False)] for _ in range(n)],
+        "playcount": rng.integers(0, 5_000_000, n),
+        "popularity": rng.integers(0, 100, n),
+        "similar_songs": [[{"name": f"Track {j}", "artist": f"Artist {j}"} for j in rng.integers(0, n, 3)]
+                          for _ in range(n)],
+    })
+
+
+def best(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def csv_path():
+    return os.path.join(datasets_dir(USER_ID), "user_songs.csv")
+
+
+def csv_write(df):
+    df.to_csv(csv_path(), index=False)
+
+
+def csv_load_plot_frame():
+    # load_user_data before the Parquet store: read everything, parse the reprs.
+    df = pd.read_csv(csv_path())
+    df = df.drop(columns=["similar_songs", "name_url", "artist_url", "album_url", "album_art", "popularity"])
+    df["genres"] = df["genres"].apply(ast.literal_eval)
+    return df
+
+
+def csv_load_records():
+    # read_tracks_csv before the Parquet store, as used by /tracks.
+    df = pd.read_csv(csv_path())
+    for col in ["genres", "similar_songs"]:
+        df[col] = df[col].apply(lambda x: ast.literal_eval(x) if pd.notna(x) else [])
+    return df.to_dict(orient="records")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    os.makedirs(os.path.dirname(csv_path()), exist_ok=True)
+
+    df = library(args.tracks)
+    rows = [
+        ("write", lambda: csv_write(df), lambda: write_dataset(USER_ID, "user_songs", df.copy())),
+        ("load plot columns", csv_load_plot_frame, lambda: read_dataset(USER_ID, "user_songs", columns=PLOT_COLUMNS)),
+        ("load records", csv_load_records, lambda: read_records(USER_ID, "user_songs")),
+    ]
+    print(f"{args.tracks} tracks, best of {args.repeat}")
+    print(f"{'':<20} {'CSV':>10} {'Parquet':>10} {'speedup':>8}")
+    for label, old, new in rows:
+        before, after = best(old, args.repeat), best(new, args.repeat)
+        print(f"{label:<20} {before * 1000:8.1f}ms {after * 1000:8.1f}ms {before / after:7.1f}x")
+    print(f"{'file size':<20} {os.path.getsize(csv_path()) / 1024:8.0f}KB "
+          f"{os.path.getsize(dataset_path(USER_ID, 'user_songs')) / 1024:8.0f}KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Microbenchmark vectorized genre normalization against the row-wise passes it replaced.
+
+load_user_data used to parse each row's genre repr with ast.literal_eval,
+then alias, dedupe/sort and filter empty lists in three more .apply passes.
+utils.aggregates.normalize_genres does the same on the Arrow list column
+in one vectorized pass. The row-wise timings are given with and without
+the repr parsing, which the Parquet store made unnecessary.
+
+    python -m bench.genres [--rows 1000 10000 100000] [--repeat 3]
+"""
+import ast
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from utils.aggregates import normalize_genres
+from bench.datasets import best
+
+GENRES = [f"genre {i}" for i in range(300)] + ["Hip-Hop", "hip hop", "hip-hop"]
+
+
+def genre_lists(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return [[str(g) for g in rng.choice(GENRES, rng.integers(0, 5))] for _ in range(n)]
+
+
+def row_wise(genres):
+    genres = genres.apply(lambda lst: ['hip hop' if g.lower() in ['hip-hop', 'hip hop'] else g for g in lst])
+    genres = genres.apply(lambda lst: sorted(set(lst)))
+    return genres[genres.apply(lambda x: len(x) > 0)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"best of {args.repeat}")
+    print(f"{'rows':>8} {'parse + rows':>13} {'row-wise':>10} {'vectorized':>11} {'speedup':>8}")
+    for n in args.rows:
+        lists = genre_lists(n)
+        reprs = pd.Series([repr(lst) for lst in lists])
+        series = pd.Series(lists)
+        column = pa.array(lists, pa.list_(pa.string()))
+
+        parsed = best(lambda: row_wise(reprs.apply(ast.literal_eval)), args.repeat)
+        rows = best(lambda: row_wise(series), args.repeat)
+        vectorized = best(lambda: normalize_genres(column), args.repeat)
+
+        expected = row_wise(series)
+        got = normalize_genres(column)
+        assert expected.index.tolist() == got.index.tolist()
+        assert all(list(a) == list(b) for a, b in zip(expected, got))
+        print(f"{n:8d} {parsed * 1000:11.1f}ms {rows * 1000:8.1f}ms {vectorized * 1000:9.1f}ms {rows / vectorized:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Stress test request coalescing with 50 simultaneous logins across worker processes.
+
+Each simulated login pages through its playlists with its own token and
+queues a Last.fm lookup for the artists of each page as it arrives, the
+way the setup job does; most artists are shared with other users. The
+logins are spread over --processes worker processes, as under gunicorn,
+and released at once against a local mock upstream.
+
+Checks that:
+- every caller gets the response to its own request;
+- responses to token-bearing requests are never shared between users or
+  written to the shared flights directory;
+- every call was either made upstream or served by an identical one in
+  flight (calls == upstream requests + saved);
+- concurrent identical artist lookups were coalesced, within and across
+  processes.
+Exits with status 1 if a check fails.
+
+    python -m bench.login_stress [--logins 50] [--processes 4] [--artists 200] [--latency-ms 100]
+"""
+import os
+import sys
+import random
+import argparse
+import tempfile
+import threading
+import multiprocessing
+
+# Files the app writes go to a scratch directory instead of its temp/;
+# worker processes inherit it, so they share the flights directory.
+os.environ.setdefault("PLAYLISTR_TEMP_DIR", tempfile.mkdtemp(prefix="playlistr-bench-"))
+
+from auth import client
+from bench.mock_upstream import MockUpstream
+
+ARTISTS_PER_LOGIN = 40
+# Artists are queued for lookup page by page, as the playlist pages arrive.
+ARTISTS_PER_PAGE = 5
+
+
+def run_logins(url, host, users, n_artists, barrier, results):
+    """Worker process: run the given logins in threads once every process is ready."""
+    client.HOST_LIMITS[host] = 8
+    client.HOST_RATES[host] = 1e9
+    errors = []
+    go = threading.Event()
+
+    def check(ok, message):
+        if not ok:
+            errors.append(message)
+
+    def login(user):
+        rng = random.Random(user)
+        token = f"Bearer user-{user}"
+        go.wait()
+        executor = client.executor_for(url)
+        artists = sorted(rng.sample(range(n_artists), ARTISTS_PER_LOGIN))
+        futures = {}
+        for page in range(0, ARTISTS_PER_LOGIN, ARTISTS_PER_PAGE):
+            path = f"/v1/me/playlists/{page}"
+            body = client.get(url + path, headers={"Authorization": token}).json()
+            check(body["auth"] == token and body["path"] == path, f"user {user} got {body} for {path}")
+            for a in artists[page:page + ARTISTS_PER_PAGE]:
+                futures[a] = executor.submit(client.get, url + "/2.0/",
+                                             params={"method": "artist.getInfo", "artist": f"Artist {a}"})
+        for a, future in futures.items():
+            body = future.result().json()
+            check(body["query"].get("artist") == [f"Artist {a}"] and body["auth"] is None,
+                  f"user {user} got {body} for Artist {a}")
+
+    threads = [threading.Thread(target=login, args=(user,)) for user in users]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    go.set()
+    for t in threads:
+        t.join()
+    results.put({"stats": client.flight_stats(), "errors": errors})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=50)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--artists", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=100)
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    barrier = ctx.Barrier(args.processes)
+    results = ctx.Queue()
+    with MockUpstream(latency=args.latency_ms / 1000, echo=True) as upstream:
+        workers = [ctx.Process(target=run_logins,
+                               args=(upstream.url, upstream.host, range(p, args.logins, args.processes),
+                                     args.artists, barrier, results))
+                   for p in range(args.processes)]
+        for w in workers:
+            w.start()
+        reports = [results.get() for _ in workers]
+        for w in workers:
+            w.join()
+        upstream_total = upstream.total_requests()
+        upstream_lookups = upstream.requests["/2.0/"]
+
+    totals = {k: sum(r["stats"][k] for r in reports) for k in ("calls", "coalesced_local", "coalesced_shared")}
+    saved = totals["coalesced_local"] + totals["coalesced_shared"]
+    lookups = args.logins * ARTISTS_PER_LOGIN
+    errors = [e for r in reports for e in r["errors"]]
+
+    flights_dir = client.FLIGHTS_DIR
+    for name in os.listdir(flights_dir) if os.path.isdir(flights_dir) else []:
+        with open(os.path.join(flights_dir, name), "rb") as f:
+            if b"Bearer" in f.read():
+                errors.append(f"token-bearing response written to {name}")
+    if totals["calls"] != upstream_total + saved:
+        errors.append(f"{totals['calls']} calls but {upstream_total} upstream requests and {saved} saved")
+    if not totals["coalesced_local"] or not totals["coalesced_shared"]:
+        errors.append("lookups were not coalesced both within and across processes")
+
+    print(f"{args.logins} logins over {args.processes} processes, {args.latency_ms:.0f} ms upstream latency")
+    print(f"calls {totals['calls']}, upstream requests {upstream_total}, saved {saved} "
+          f"({totals['coalesced_local']} in-process, {totals['coalesced_shared']} across processes)")
+    print(f"artist lookups: {lookups} calls for {min(args.artists, lookups)} artists, "
+          f"{upstream_lookups} sent upstream")
+    for error in errors[:20]:
+        print(f"FAIL: {error}")
+    print("FAIL" if errors else "OK")
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
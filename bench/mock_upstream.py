@@ -0,0 +1,97 @@
+"""Local stand-in for the Spotify and Last.fm APIs, used by the scripts in bench/.
+
+Every GET is answered with a small JSON body after ``latency`` seconds.
+With ``echo``, the body instead repeats the request's path, query and
+Authorization header, so callers can check they got their own response.
+``connect_latency`` is added once per new connection, as a stand-in for the
+TCP and TLS handshakes a real upstream costs. Requests and connections are
+counted, per path and per full URL.
+"""
+import json
+import time
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+
+class MockUpstream:
+    def __init__(self, latency=0.02, connect_latency=0.0, body_bytes=2048, echo=False):
+        self.latency = latency
+        self.connect_latency = connect_latency
+        self.body = json.dumps({"items": [], "next": None, "padding": "x" * body_bytes}).encode()
+        self.echo = echo
+        self.requests = Counter()
+        self.urls = Counter()
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.server.request_queue_size = 256
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    @property
+    def host(self):
+        return urlparse(self.url).netloc
+
+    def _handler(self):
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; with Nagle on, the
+            # body of a keep-alive response waits for the client's delayed ACK.
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with upstream.lock:
+                    upstream.connections += 1
+                time.sleep(upstream.connect_latency)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                with upstream.lock:
+                    upstream.requests[url.path] += 1
+                    upstream.urls[self.path] += 1
+                time.sleep(upstream.latency)
+                body = upstream.body
+                if upstream.echo:
+                    body = json.dumps({"path": url.path, "query": parse_qs(url.query),
+                                       "auth": self.headers.get("Authorization")}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def total_requests(self):
+        with self.lock:
+            return sum(self.requests.values())
+
+    def reset(self):
+        with self.lock:
+            self.requests.clear()
+            self.urls.clear()
+            self.connections = 0
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
@@ -0,0 +1,101 @@
+"""Benchmark TrackColumns against the dict-per-row track parsing it replaced.
+
+The fetchers used to build a dict per track, append it to a list and turn
+the list into a DataFrame; TrackColumns appends each field straight into
+per-column lists. Both parse the same synthetic Spotify playlist pages
+(100 items each) into a frame of the same columns.
+
+    python -m bench.parser [--items 50000] [--repeat 5]
+"""
+import argparse
+import tracemalloc
+import pandas as pd
+from auth.tracks import TRACK_FIELDS, TrackColumns, tracks_frame
+from bench.datasets import best
+
+PAGE = 100
+
+
+def playlist_pages(n):
+    items = [{
+        "track": {
+            "name": f"Track {i}",
+            "external_urls": {"spotify": f"https://open.spotify.com/track/{i:022d}"},
+            "artists": [{"name": f"Artist {i % 997}", "id": f"{i % 997:022d}",
+                         "external_urls": {"spotify": f"https://open.spotify.com/artist/{i % 997:022d}"}}],
+            "album": {
+                "name": f"Album {i % 4001}",
+                "release_date": f"{1960 + i % 65}-01-01",
+                "external_urls": {"spotify": f"https://open.spotify.com/album/{i % 4001:022d}"},
+                "images": [{"url": f"https://i.scdn.co/image/{i % 4001:040d}", "height": 640}],
+            },
+            "duration_ms": 200_000,
+            "popularity": i % 100,
+        },
+    } for i in range(n)]
+    return [items[i:i + PAGE] for i in range(0, n, PAGE)]
+
+
+def parse_dicts(pages):
+    tracks = []
+    for items in pages:
+        for item in items:
+            t = item.get("track")
+            if not t:
+                continue
+            artist = t.get("artists", [{}])[0]
+            album = t.get("album", {})
+            release_date = album.get("release_date", "1900")
+            tracks.append({
+                "playlist": "Bench",
+                "name": t.get("name", ""),
+                "name_url": t.get("external_urls", {}).get("spotify", ""),
+                "artist": artist.get("name", ""),
+                "artist_id": artist.get("id"),
+                "artist_url": artist.get("external_urls", {}).get("spotify", ""),
+                "album": album.get("name", ""),
+                "album_url": album.get("external_urls", {}).get("spotify", ""),
+                "year": int(release_date[:4]) if release_date else 1900,
+                "album_art": album.get("images", [{}])[0].get("url", ""),
+                "genres": [],
+                "similar_songs": [],
+            })
+    return pd.DataFrame(tracks, columns=["playlist", *TRACK_FIELDS])
+
+
+def parse_columns(pages):
+    batches = []
+    for items in pages:
+        batch = TrackColumns("Bench")
+        batch.add_items(items)
+        batches.append(batch)
+    return tracks_frame(batches)
+
+
+def peak_bytes(fn, pages):
+    tracemalloc.start()
+    fn(pages)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    pages = playlist_pages(args.items)
+    pd.testing.assert_frame_equal(parse_dicts(pages), parse_columns(pages))
+    print(f"{args.items} playlist items in pages of {PAGE}, best of {args.repeat}")
+    print(f"{'':<16} {'time':>9} {'peak memory':>12}")
+    results = {}
+    for label, fn in [("dict per row", parse_dicts), ("TrackColumns", parse_columns)]:
+        results[label] = best(lambda: fn(pages), args.repeat)
+        print(f"{label:<16} {results[label] * 1000:7.1f}ms {peak_bytes(fn, pages) / 1024 / 1024:10.1f}MB")
+    print(f"speedup {results['dict per row'] / results['TrackColumns']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
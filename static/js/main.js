@@ -105,6 +105,105 @@ document.addEventListener("DOMContentLoaded", () => {
       .catch(err => console.error(`Failed to load plot JSON for ${canvasId}:`, err));
   }
 
+  const chartPalette = ['#1DB954', '#6d5dfc', '#ff4400', '#4bd183', '#f5c518',
+                        '#00bcd4', '#e91e63', '#8bc34a', '#ff9800', '#9c27b0'];
+
+  function renderUserCharts() {
+    if (!document.getElementById('genresWordCloud')) return;
+
+    fetch('/chart_data')
+      .then(response => response.json())
+      .then(data => {
+        renderWordCloud('genresWordCloud', data.genres.genre, data.genres.count);
+        renderWordCloud('artistsWordCloud', data.artists.artist, data.artists.count);
+        renderPlaycountDistribution('playcountDistributionChart', data.playcount_distribution, data.metric);
+        renderYearPlaycount('yearPlaycountChart', data.polar, data.metric);
+      })
+      .catch(err => console.error('Failed to load chart data:', err));
+  }
+
+  function renderWordCloud(canvasId, labels, counts) {
+    const canvas = document.getElementById(canvasId);
+    if (!canvas || !labels.length) return;
+
+    const max = Math.max(...counts);
+    new Chart(canvas.getContext('2d'), {
+      type: 'wordCloud',
+      data: {
+        labels: labels,
+        datasets: [{
+          label: 'Count',
+          data: counts.map(c => 10 + 40 * c / max),
+          color: labels.map((_, i) => chartPalette[i % chartPalette.length])
+        }]
+      },
+      options: {
+        maintainAspectRatio: false,
+        plugins: { legend: { display: false } }
+      }
+    });
+  }
+
+  function renderPlaycountDistribution(canvasId, dist, metric) {
+    const canvas = document.getElementById(canvasId);
+    if (!canvas) return;
+
+    // Each playlist's share of the tracks in every log(1 + metric) bin.
+    const playlists = Object.keys(dist.playlists);
+    const totals = dist.bins.map((_, i) => playlists.reduce((sum, pl) => sum + dist.playlists[pl][i], 0));
+    new Chart(canvas.getContext('2d'), {
+      type: 'line',
+      data: {
+        labels: dist.bins,
+        datasets: playlists.map((pl, k) => ({
+          label: pl,
+          data: dist.playlists[pl].map((c, i) => totals[i] ? c / totals[i] : 0),
+          fill: true,
+          backgroundColor: chartPalette[k % chartPalette.length] + '99',
+          borderWidth: 0,
+          pointRadius: 0,
+          tension: 0.4
+        }))
+      },
+      options: {
+        maintainAspectRatio: false,
+        responsive: true,
+        scales: {
+          x: { title: { display: true, text: `log(1 + ${metric})` } },
+          y: { stacked: true, min: 0, max: 1, display: false }
+        }
+      }
+    });
+  }
+
+  function renderYearPlaycount(canvasId, polar, metric) {
+    const canvas = document.getElementById(canvasId);
+    if (!canvas) return;
+
+    const points = polar.points;
+    const maxPlaycount = Math.max(1, ...points.playcount);
+    new Chart(canvas.getContext('2d'), {
+      type: 'bubble',
+      data: {
+        datasets: polar.playlists.map((pl, k) => ({
+          label: pl,
+          data: points.playlist
+            .map((p, i) => p === pl ? { x: points.year[i], y: points.playcount[i], r: 2 + 10 * points.playcount[i] / maxPlaycount } : null)
+            .filter(Boolean),
+          backgroundColor: chartPalette[k % chartPalette.length] + '55'
+        }))
+      },
+      options: {
+        maintainAspectRatio: false,
+        responsive: true,
+        scales: {
+          x: { min: polar.min_year, max: polar.max_year, ticks: { precision: 0 } },
+          y: { title: { display: true, text: metric } }
+        }
+      }
+    });
+  }
+
   // -----------------------------
   // Header AJAX buttons
   // -----------------------------
@@ -140,6 +239,7 @@ document.addEventListener("DOMContentLoaded", () => {
         renderBarChart('genresBarChart', 'wordcloud_genres', 'top_genres', '#1DB954');
         renderBarChart('artistsBarChart', 'wordcloud_artists', 'top_artists', '#1DB954');
         renderBarChart('playcountBarChart', 'playcount_distribution', 'top_playlists', '#1DB954');
+        renderUserCharts();
 
         newHeaderBtns.forEach(b => {
           b.style.color = "";
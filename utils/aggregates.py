@@ -0,0 +1,207 @@
+import os
+import fcntl
+import sqlite3
+import hashlib
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from utils.store import read_table, datasets_dir
+from utils.files import replacing
+
+PLOT_DATASETS = ["top_tracks", "recent_tracks", "user_songs"]
+PLOT_COLUMNS = ["playlist", "name", "artist", "album", "year", "genres", "playcount"]
+# Artist metric the playcount charts are drawn from, read into the plot
+# frame's "playcount" column: Spotify followers ("followers") when artist
+# info comes from Spotify, Last.fm listeners ("playcount") when it comes from
+# Last.fm. Tracks whose artist has no value for the metric (e.g. a Spotify
+# lookup that fell back to Last.fm) are left out of the playcount tables
+# rather than counted as 0; they still count towards genres, artists and years.
+PLAYCOUNT_METRIC = "followers" if os.environ.get("ARTIST_INFO_SOURCE", "spotify") == "spotify" else "playcount"
+PLAYCOUNT_METRIC_LABELS = {"followers": "Spotify followers", "playcount": "Last.fm listeners"}
+
+# Lower-cased genre spellings mapped to the name they are counted under.
+# Genres not listed keep their original spelling.
+GENRE_ALIASES = {
+    "hip-hop": "hip hop",
+    "hip hop": "hip hop",
+}
+
+def normalize_genres(genres, aliases=GENRE_ALIASES):
+    """Alias, dedupe and sort every row's genres in one vectorized pass.
+
+    ``genres`` is a pyarrow list<string> column. Genre strings are dictionary
+    encoded, and duplicate (row, genre) pairs are dropped by sorting integer
+    keys, so no Python code runs per row. Returns a Series of sorted genre
+    arrays indexed by row position, holding only rows with at least one genre.
+    """
+    if isinstance(genres, pa.ChunkedArray):
+        genres = genres.combine_chunks()
+    values = pc.list_flatten(genres)
+    rows = pc.list_parent_indices(genres).to_numpy()
+
+    alias_index = pc.index_in(pc.utf8_lower(values), value_set=pa.array(list(aliases), pa.string()))
+    aliased = pc.take(pa.array(list(aliases.values()), pa.string()), alias_index)
+    canonical = pc.coalesce(aliased, values)
+
+    valid = pc.is_valid(canonical)
+    encoded = pc.dictionary_encode(canonical.filter(valid))
+    names = encoded.dictionary.to_numpy(zero_copy_only=False)
+    order = np.argsort(names, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+
+    width = max(len(names), 1)
+    keys = rows[valid.to_numpy(zero_copy_only=False)].astype(np.int64) * width + rank[encoded.indices.to_numpy()]
+    keys.sort()
+    keys = keys[np.r_[True, keys[1:] != keys[:-1]]] if len(keys) else keys
+    out_rows, out_ranks = np.divmod(keys, width)
+    starts = np.flatnonzero(np.r_[True, out_rows[1:] != out_rows[:-1]]) if len(keys) else np.array([], dtype=np.int64)
+    offsets = pa.array(np.r_[starts, len(keys)].astype(np.int32))
+    lists = pa.ListArray.from_arrays(offsets, pa.array(names[order][out_ranks], pa.string()))
+    return pd.Series(lists.to_numpy(zero_copy_only=False), index=out_rows[starts], name="genres", dtype=object)
+
+def load_user_data(user_id, aliases=GENRE_ALIASES, metric=PLAYCOUNT_METRIC):
+    columns = [c for c in PLOT_COLUMNS if c != "playcount"] + [metric]
+    tables = [read_table(user_id, name, columns=columns) for name in PLOT_DATASETS]
+    tables = [t for t in tables if t is not None]
+    if not tables:
+        raise FileNotFoundError(f"No datasets found for user at {datasets_dir(user_id)}")
+    table = pa.concat_tables(tables, promote_options="default")
+    if "genres" not in table.column_names:
+        raise ValueError(f"Datasets for user {user_id} have not been enriched with genres")
+
+    genres = normalize_genres(table.column("genres"), aliases)
+    df = table.drop_columns(["genres"]).to_pandas()
+    # NaN where the artist has no value for the metric.
+    playcount = df.pop(metric) if metric in df.columns else pd.Series(np.nan, index=df.index)
+    df = df.iloc[genres.index]
+    df = df[df.notna().all(axis=1)].copy()
+    df["playcount"] = pd.to_numeric(playcount, errors="coerce")
+    df['genres'] = genres
+    for col in ['playlist', 'artist', 'album']:
+        df[col] = df[col].astype('category')
+    return df
+
+
+AGGREGATES_DB = "aggregates.db"
+# Width of the log1p(playcount) bins the playcount distribution is drawn from.
+PLAYCOUNT_BIN = 0.05
+
+# Columns each aggregate table is indexed on.
+AGGREGATE_INDEXES = {
+    "genre_counts": ["genre"],
+    "artist_counts": ["artist"],
+    "playlist_totals": ["playlist"],
+    "playlist_genres": ["playlist", "genre"],
+    "playcount_hist": ["playlist"],
+    "year_counts": ["year"],
+    "playlist_year_playcount": ["playlist", "year"],
+    "top_tracks": ["playcount"],
+    "edges": ["artist", "genre", "playlist"],
+}
+
+
+def aggregates_path(user_id):
+    return os.path.join(datasets_dir(user_id), AGGREGATES_DB)
+
+
+def compute_aggregates(df):
+    """Reduce the plot frame to the small tables every plot and explanation reads.
+
+    Counts over genres are taken on (track, genre) rows, as the plots have
+    always done. Tracks without a playcount (NaN) are left out of the
+    playcount totals, histogram, points and top tracks; playlist_totals
+    counts the tracks that have one as "measured". All tables are sorted
+    with the largest values first.
+    """
+    rows = pd.DataFrame({
+        "playlist": df["playlist"].astype(str).to_numpy(),
+        "artist": df["artist"].astype(str).to_numpy(),
+        "name": df["name"].to_numpy(),
+        "year": df["year"].astype(int).to_numpy(),
+        "playcount": pd.to_numeric(df["playcount"], errors="coerce").to_numpy(dtype=float),
+    })
+    exploded = rows.assign(genre=df["genres"].to_numpy()).explode("genre", ignore_index=True)
+    measured = rows.dropna(subset=["playcount"]).astype({"playcount": np.int64})
+    measured_exploded = exploded.dropna(subset=["playcount"]).astype({"playcount": np.int64})
+
+    def counts(frame, keys):
+        return (frame.groupby(keys).size().rename("count").reset_index()
+                .sort_values(["count", *keys], ascending=[False] + [True] * len(keys), ignore_index=True))
+
+    playlist_totals = (rows.groupby("playlist").size().rename("tracks").to_frame()
+                       .join(measured.groupby("playlist").size().rename("measured"))
+                       .join(measured_exploded.groupby("playlist")["playcount"].sum())
+                       .fillna({"measured": 0, "playcount": 0}).astype({"measured": np.int64, "playcount": np.int64})
+                       .reset_index()
+                       .sort_values(["tracks", "playlist"], ascending=[False, True], ignore_index=True))
+
+    hist = measured_exploded.assign(
+        log_playcount=(np.log1p(measured_exploded["playcount"]) / PLAYCOUNT_BIN).round() * PLAYCOUNT_BIN)
+    playcount_hist = (hist.groupby(["playlist", "log_playcount"]).size().rename("count")
+                      .reset_index().sort_values(["playlist", "log_playcount"], ignore_index=True))
+
+    return {
+        "genre_counts": counts(exploded, ["genre"]),
+        "artist_counts": counts(rows, ["artist"]),
+        "playlist_totals": playlist_totals,
+        "playlist_genres": counts(exploded, ["playlist", "genre"]),
+        "playcount_hist": playcount_hist,
+        "year_counts": counts(rows, ["year"]).sort_values("year", ignore_index=True),
+        "playlist_year_playcount": counts(measured, ["playlist", "year", "playcount"]),
+        "top_tracks": (measured.sort_values("playcount", ascending=False, kind="stable")
+                       .drop_duplicates("name").head(50)[["name", "year", "playcount"]]
+                       .reset_index(drop=True)),
+        "edges": counts(exploded, ["artist", "genre", "playlist"]),
+    }
+
+
+def build_aggregates(user_id):
+    """Compute the user's aggregates and store them, replacing the old file atomically.
+
+    Builds for one user are serialized on a lock file, and each writes its
+    own temporary file, so readers only ever open a complete database.
+    """
+    path = aggregates_path(user_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        aggregates = compute_aggregates(load_user_data(user_id))
+        with replacing(path) as tmp_path:
+            conn = sqlite3.connect(tmp_path)
+            try:
+                for name, table in aggregates.items():
+                    table.to_sql(name, conn, index=False)
+                    columns = ", ".join(AGGREGATE_INDEXES[name])
+                    conn.execute(f"CREATE INDEX {name}_idx ON {name} ({columns})")
+                conn.commit()
+            finally:
+                conn.close()
+    print(f"[DataEDA] Aggregates built for user {user_id}: "
+          + ", ".join(f"{name} {len(table)}" for name, table in aggregates.items()))
+    return aggregates
+
+
+def table_hashes(aggregates):
+    """Content hash of each aggregate table, so plots can tell which of their inputs changed."""
+    return {name: hashlib.sha256(",".join(table.columns).encode()
+                                 + pd.util.hash_pandas_object(table, index=False).to_numpy().tobytes()).hexdigest()
+            for name, table in aggregates.items()}
+
+
+def read_aggregates(user_id, names=None):
+    """Return {name: DataFrame} for the stored aggregate tables.
+
+    Reads the last complete aggregates.db, which the setup job builds;
+    raises FileNotFoundError if it has not been built yet.
+    """
+    path = aggregates_path(user_id)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No aggregates built for user {user_id} at {path}")
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        return {name: pd.read_sql_query(f"SELECT * FROM {name}", conn)
+                for name in (names or AGGREGATE_INDEXES)}
+    finally:
+        conn.close()
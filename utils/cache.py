@@ -0,0 +1,199 @@
+import os
+import json
+import time
+import sqlite3
+from utils.files import TEMP_DIR
+
+CACHE_DB = os.path.join(TEMP_DIR, "cache.db")
+
+
+def normalize_key(*parts):
+    return "::".join(str(p).strip().lower() for p in parts)
+
+
+class DiskCache:
+    """SQLite-backed key/value cache shared by every worker process.
+
+    Values are stored as JSON and expire ``ttl`` seconds after being written,
+    or ``negative_ttl`` seconds for entries written with ``negative=True``.
+    With ``max_entries`` set, the least recently used entries are evicted once
+    the table grows past that size. Hit and miss counts are kept in the same
+    database so the hit rate covers all workers, not just the current process.
+    """
+
+    def __init__(self, name, ttl, max_entries=None, negative_ttl=None, path=CACHE_DB):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.negative_ttl = negative_ttl if negative_ttl is not None else ttl
+        self.path = path
+        self._init_db()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _init_db(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {self.name} (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_used REAL NOT NULL DEFAULT 0
+                )
+            """)
+            columns = [row[1] for row in conn.execute(f"PRAGMA table_info({self.name})")]
+            if "last_used" not in columns:
+                conn.execute(f"ALTER TABLE {self.name} ADD COLUMN last_used REAL NOT NULL DEFAULT 0")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {self.name}_lru ON {self.name} (last_used)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache_stats (
+                    name TEXT PRIMARY KEY,
+                    hits INTEGER DEFAULT 0,
+                    misses INTEGER DEFAULT 0
+                )
+            """)
+            conn.execute("INSERT OR IGNORE INTO cache_stats (name) VALUES (?)", (self.name,))
+        finally:
+            conn.close()
+
+    def get_many(self, keys):
+        """Return {key: value} for every key that has a live entry."""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        now = time.time()
+        conn = self._connect()
+        try:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                placeholders = ", ".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT key, value FROM {self.name} WHERE key IN ({placeholders}) AND expires_at > ?",
+                    (*chunk, now),
+                )
+                found.update((k, json.loads(v)) for k, v in rows)
+            if self.max_entries and found:
+                hit_keys = list(found)
+                for i in range(0, len(hit_keys), 500):
+                    chunk = hit_keys[i:i + 500]
+                    placeholders = ", ".join("?" * len(chunk))
+                    conn.execute(
+                        f"UPDATE {self.name} SET last_used = ? WHERE key IN ({placeholders})",
+                        (now, *chunk),
+                    )
+            conn.execute(
+                "UPDATE cache_stats SET hits = hits + ?, misses = misses + ? WHERE name = ?",
+                (len(found), len(keys) - len(found), self.name),
+            )
+        finally:
+            conn.close()
+        return found
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def set_many(self, items, negative=False):
+        """Store items; negative entries record failed lookups for ``negative_ttl``."""
+        now = time.time()
+        ttl = self.negative_ttl if negative else self.ttl
+        rows = [(k, json.dumps(v), now + ttl, now) for k, v in items.items()]
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                f"INSERT OR REPLACE INTO {self.name} (key, value, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            conn.execute(f"DELETE FROM {self.name} WHERE expires_at <= ?", (now,))
+            if self.max_entries:
+                conn.execute(
+                    f"DELETE FROM {self.name} WHERE key IN ("
+                    f"SELECT key FROM {self.name} ORDER BY last_used ASC "
+                    f"LIMIT MAX(0, (SELECT COUNT(*) FROM {self.name}) - ?))",
+                    (self.max_entries,),
+                )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def set(self, key, value, negative=False):
+        self.set_many({key: value}, negative=negative)
+
+    def stats(self):
+        conn = self._connect()
+        try:
+            hits, misses = conn.execute(
+                "SELECT hits, misses FROM cache_stats WHERE name = ?", (self.name,)
+            ).fetchone()
+            size = conn.execute(f"SELECT COUNT(*) FROM {self.name}").fetchone()[0]
+        finally:
+            conn.close()
+        lookups = hits + misses
+        return {
+            "entries": size,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+LASTFM_ARTIST_TTL = int(os.environ.get("LASTFM_ARTIST_TTL", 30 * 24 * 3600))
+LASTFM_SIMILAR_TTL = int(os.environ.get("LASTFM_SIMILAR_TTL", 14 * 24 * 3600))
+LASTFM_SIMILAR_NEGATIVE_TTL = int(os.environ.get("LASTFM_SIMILAR_NEGATIVE_TTL", 24 * 3600))
+LASTFM_SIMILAR_MAX_ENTRIES = int(os.environ.get("LASTFM_SIMILAR_MAX_ENTRIES", 200_000))
+
+_artist_caches = {}
+_similar_cache = None
+
+# Artist info is cached per source: "spotify" entries carry Spotify genres
+# and followers, "lastfm" entries Last.fm tags and listeners. The table they
+# used to share is dropped.
+ARTIST_INFO_SOURCES = ("spotify", "lastfm")
+LEGACY_ARTIST_TABLE = "lastfm_artists"
+
+
+def _drop_legacy_artist_cache(path=CACHE_DB):
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    try:
+        conn.execute(f"DROP TABLE IF EXISTS {LEGACY_ARTIST_TABLE}")
+        conn.execute("DELETE FROM cache_stats WHERE name = ?", (LEGACY_ARTIST_TABLE,))
+    finally:
+        conn.close()
+
+
+def get_artist_cache(source):
+    """Shared cache of artist info resolved with ``source``.
+
+    Values are {"genres": [...], "listeners": int or None, "followers": int or None, "popularity": int or None}.
+    """
+    if source not in ARTIST_INFO_SOURCES:
+        raise ValueError(f"Unknown artist info source {source!r}")
+    if source not in _artist_caches:
+        cache = DiskCache(f"artists_{source}", LASTFM_ARTIST_TTL)
+        _drop_legacy_artist_cache(cache.path)
+        _artist_caches[source] = cache
+    return _artist_caches[source]
+
+
+def get_similar_cache():
+    """Shared cache of Last.fm track.getsimilar results keyed by "artist::track"."""
+    global _similar_cache
+    if _similar_cache is None:
+        _similar_cache = DiskCache(
+            "lastfm_similar",
+            LASTFM_SIMILAR_TTL,
+            max_entries=LASTFM_SIMILAR_MAX_ENTRIES,
+            negative_ttl=LASTFM_SIMILAR_NEGATIVE_TTL,
+        )
+    return _similar_cache
+
+
+def cache_metrics():
+    return {
+        **{f"artists_{source}": get_artist_cache(source).stats() for source in ARTIST_INFO_SOURCES},
+        "lastfm_similar": get_similar_cache().stats(),
+    }
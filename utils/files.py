@@ -0,0 +1,32 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Every process keeps its databases, caches and per-user files under this
+# one directory, wherever the app was started from.
+TEMP_DIR = os.path.abspath(os.environ.get("PLAYLISTR_TEMP_DIR", os.path.join(PROJECT_ROOT, "temp")))
+
+
+def user_dir(user_id):
+    return os.path.join(TEMP_DIR, user_id)
+
+
+@contextmanager
+def replacing(path):
+    """Yield a new temporary file next to path, moved over path once written.
+
+    Each write gets its own file, so concurrent writers of the same path,
+    in any process or thread, never share one; readers see either the old
+    file or the new one. The temporary file is created readable by its
+    owner only, and is removed if writing fails.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=f"{os.path.basename(path)}.",
+                                    suffix=".tmp")
+    os.close(fd)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
@@ -0,0 +1,275 @@
+import os
+import time
+import sqlite3
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from utils.files import TEMP_DIR
+
+JOBS_DB = os.path.join(TEMP_DIR, "jobs.db")
+JOB_WORKERS = int(os.environ.get("PLAYLISTR_JOB_WORKERS", 2))
+# Jobs run in the process that queued them, which records its pid on the row
+# and heartbeats its jobs this often. A queued or running job whose owner
+# process is gone, or has not heartbeat for JOB_HEARTBEAT_TIMEOUT seconds
+# (the pid was reused, or the owner runs on another host), is marked failed.
+JOB_HEARTBEAT_SECONDS = float(os.environ.get("PLAYLISTR_JOB_HEARTBEAT_SECONDS", 10))
+JOB_HEARTBEAT_TIMEOUT = JOB_HEARTBEAT_SECONDS * 6
+PROGRESS_INTERVAL = 0.5
+# Progress events of finished jobs are kept this long for late readers.
+EVENT_RETENTION_SECONDS = int(os.environ.get("PLAYLISTR_EVENT_RETENTION_SECONDS", 24 * 3600))
+
+ACTIVE_STATUSES = ("queued", "running")
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="playlistr-job")
+_submit_lock = threading.Lock()
+# Ids of the jobs queued or running in this process, kept alive by _heartbeat().
+_owned = set()
+_owned_lock = threading.Lock()
+_heartbeat_thread = None
+
+
+def _connect():
+    os.makedirs(os.path.dirname(JOBS_DB), exist_ok=True)
+    conn = sqlite3.connect(JOBS_DB, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            status TEXT NOT NULL,
+            stage TEXT,
+            progress INTEGER DEFAULT 0,
+            total INTEGER DEFAULT 0,
+            error TEXT,
+            owner_pid INTEGER,
+            heartbeat REAL,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    """)
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(jobs)")]
+    for column, kind in [("owner_pid", "INTEGER"), ("heartbeat", "REAL")]:
+        if column not in columns:
+            conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+    conn.execute("CREATE INDEX IF NOT EXISTS jobs_user ON jobs (user_id, id)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS job_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id INTEGER NOT NULL,
+            stage TEXT NOT NULL,
+            done INTEGER DEFAULT 0,
+            total INTEGER DEFAULT 0,
+            message TEXT,
+            created_at REAL NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS job_events_job ON job_events (job_id, id)")
+    return conn
+
+
+def update_job(job_id, **fields):
+    fields["updated_at"] = time.time()
+    columns = ", ".join(f"{k} = ?" for k in fields)
+    conn = _connect()
+    try:
+        conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+    finally:
+        conn.close()
+
+
+def add_job_event(job_id, stage, done=0, total=0, message=None):
+    conn = _connect()
+    try:
+        conn.execute(
+            "INSERT INTO job_events (job_id, stage, done, total, message, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, stage, done, total, message, time.time()),
+        )
+    finally:
+        conn.close()
+
+
+def get_job_events(job_id, after_id=0, limit=500):
+    """Return job_id's progress events with an id greater than after_id, oldest first."""
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            "SELECT * FROM job_events WHERE job_id = ? AND id > ? ORDER BY id LIMIT ?",
+            (job_id, after_id, limit),
+        ).fetchall()
+    finally:
+        conn.close()
+    return [dict(row) for row in rows]
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _reap_dead_jobs(conn, where="", params=()):
+    """Mark queued/running jobs whose owner process is gone as failed.
+
+    ``where`` narrows the jobs checked, e.g. "AND user_id = ?". Each dead
+    job gets a final "failed" event, so /setup/events ends its stream.
+    """
+    now = time.time()
+    rows = conn.execute(
+        f"SELECT id, owner_pid, heartbeat FROM jobs WHERE status IN {ACTIVE_STATUSES} {where}", params
+    ).fetchall()
+    for row in rows:
+        if (row["owner_pid"] is not None and _process_alive(row["owner_pid"])
+                and (row["heartbeat"] or 0) > now - JOB_HEARTBEAT_TIMEOUT):
+            continue
+        cur = conn.execute(
+            f"UPDATE jobs SET status = 'failed', error = 'Job interrupted', updated_at = ? "
+            f"WHERE id = ? AND status IN {ACTIVE_STATUSES}",
+            (now, row["id"]),
+        )
+        if cur.rowcount:
+            conn.execute(
+                "INSERT INTO job_events (job_id, stage, message, created_at) VALUES (?, 'failed', 'Job interrupted', ?)",
+                (row["id"], now),
+            )
+            print(f"[Jobs] Job {row['id']} lost its worker process {row['owner_pid']}, marked failed")
+
+
+def get_job(job_id):
+    conn = _connect()
+    try:
+        _reap_dead_jobs(conn, "AND id = ?", (job_id,))
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    finally:
+        conn.close()
+    return dict(row) if row else None
+
+
+def get_latest_job(user_id):
+    conn = _connect()
+    try:
+        _reap_dead_jobs(conn, "AND user_id = ?", (user_id,))
+        row = conn.execute(
+            "SELECT * FROM jobs WHERE user_id = ? ORDER BY id DESC LIMIT 1", (user_id,)
+        ).fetchone()
+    finally:
+        conn.close()
+    return dict(row) if row else None
+
+
+def submit_job(user_id, fn, *args, **kwargs):
+    """Queue fn(job_id, *args, **kwargs) for user_id on the local worker pool.
+
+    If the user already has a queued or running job whose process is alive,
+    that job is returned instead and nothing new is scheduled.
+    """
+    now = time.time()
+    with _submit_lock:
+        conn = _connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            _reap_dead_jobs(conn)
+            conn.execute(
+                f"DELETE FROM job_events WHERE job_id IN (SELECT id FROM jobs "
+                f"WHERE status NOT IN {ACTIVE_STATUSES} AND updated_at < ?)",
+                (now - EVENT_RETENTION_SECONDS,),
+            )
+            row = conn.execute(
+                f"SELECT * FROM jobs WHERE user_id = ? AND status IN {ACTIVE_STATUSES} "
+                f"ORDER BY id DESC LIMIT 1",
+                (user_id,),
+            ).fetchone()
+            if row:
+                conn.execute("COMMIT")
+                print(f"[Jobs] Merged setup request for user {user_id} into job {row['id']}")
+                return dict(row)
+            cur = conn.execute(
+                "INSERT INTO jobs (user_id, status, stage, owner_pid, heartbeat, created_at, updated_at) "
+                "VALUES (?, 'queued', 'queued', ?, ?, ?, ?)",
+                (user_id, os.getpid(), now, now, now),
+            )
+            job_id = cur.lastrowid
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    print(f"[Jobs] Queued job {job_id} for user {user_id}")
+    with _owned_lock:
+        _owned.add(job_id)
+    _start_heartbeat()
+    _executor.submit(_run_job, job_id, fn, args, kwargs)
+    return get_job(job_id)
+
+
+def _run_job(job_id, fn, args, kwargs):
+    try:
+        update_job(job_id, status="running", stage="starting")
+        add_job_event(job_id, "starting")
+        try:
+            fn(job_id, *args, **kwargs)
+        except Exception as e:
+            traceback.print_exc()
+            update_job(job_id, status="failed", error=str(e))
+            add_job_event(job_id, "failed", message=str(e))
+            print(f"[Jobs] Job {job_id} failed: {e}")
+            return
+        update_job(job_id, status="done", stage="done")
+        add_job_event(job_id, "done")
+        print(f"[Jobs] Job {job_id} finished")
+    finally:
+        with _owned_lock:
+            _owned.discard(job_id)
+
+
+def _heartbeat():
+    while True:
+        time.sleep(JOB_HEARTBEAT_SECONDS)
+        with _owned_lock:
+            job_ids = list(_owned)
+        if not job_ids:
+            continue
+        try:
+            conn = _connect()
+            try:
+                conn.execute(f"UPDATE jobs SET heartbeat = ? WHERE id IN ({', '.join('?' * len(job_ids))})",
+                             (time.time(), *job_ids))
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"[Jobs] Heartbeat failed: {e}")
+
+
+def _start_heartbeat():
+    global _heartbeat_thread
+    with _owned_lock:
+        if _heartbeat_thread is None:
+            _heartbeat_thread = threading.Thread(target=_heartbeat, name="playlistr-job-heartbeat", daemon=True)
+            _heartbeat_thread.start()
+
+
+def job_progress(job_id):
+    """Return a progress(stage, done=0, total=0, message=None) callback for job_id.
+
+    Each call updates the job row and appends a progress event for
+    /setup/events. Count-only updates within the same stage are throttled so
+    per-item progress from the fetchers does not turn into one database write
+    per item; calls with a message are always recorded.
+    """
+    last = {"stage": None, "at": 0.0}
+
+    def progress(stage, done=0, total=0, message=None):
+        now = time.time()
+        if (message is None and stage == last["stage"] and done < total
+                and now - last["at"] < PROGRESS_INTERVAL):
+            return
+        last["stage"], last["at"] = stage, now
+        update_job(job_id, stage=stage, progress=done, total=total)
+        add_job_event(job_id, stage, done, total, message)
+
+    return progress
@@ -0,0 +1,75 @@
+import os
+import json
+import hashlib
+from utils.files import replacing, user_dir
+
+MANIFEST = "stages.json"
+HASH_BLOCK = 1024 * 1024
+
+
+def file_hash(path):
+    """SHA-256 of the file's contents, or None if it does not exist."""
+    h = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(HASH_BLOCK), b""):
+                h.update(block)
+    except FileNotFoundError:
+        return None
+    return h.hexdigest()
+
+
+def value_hash(value):
+    """SHA-256 of a JSON-serializable value, independent of dict key order."""
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class StageManifest:
+    """Per-user record of completed setup stages, stored in temp/<user_id>/stages.json.
+
+    Each stage is recorded with the inputs it ran on and the content hashes
+    of the files it wrote. A stage is current while its inputs are the same
+    and its outputs are still on disk unchanged, so a run that died part-way
+    resumes at the first stage that did not complete, and a refresh only
+    reruns the stages whose inputs changed.
+    """
+
+    def __init__(self, user_id):
+        self.user_dir = user_dir(user_id)
+        self.path = os.path.join(self.user_dir, MANIFEST)
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.stages = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.stages = {}
+
+    def get(self, stage):
+        return self.stages.get(stage)
+
+    def outputs(self, stage):
+        """{relative path: hash} of the stage's outputs, or None if it never completed."""
+        entry = self.stages.get(stage)
+        return entry["outputs"] if entry else None
+
+    def is_current(self, stage, inputs):
+        """True if stage completed with these inputs and its outputs are unchanged."""
+        entry = self.stages.get(stage)
+        if not entry or entry["inputs"] != json.loads(json.dumps(inputs, default=str)):
+            return False
+        paths = [os.path.join(self.user_dir, rel) for rel in entry["outputs"]]
+        return all(file_hash(path) == h for path, h in zip(paths, entry["outputs"].values()))
+
+    def record(self, stage, inputs, outputs, **extra):
+        """Mark stage complete with inputs, hashing the output files now on disk."""
+        self.stages[stage] = {
+            "inputs": json.loads(json.dumps(inputs, default=str)),
+            "outputs": {os.path.relpath(os.path.abspath(path), self.user_dir): file_hash(path)
+                        for path in outputs},
+            **extra,
+        }
+        self.save()
+
+    def save(self):
+        os.makedirs(self.user_dir, exist_ok=True)
+        with replacing(self.path) as tmp_path, open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.stages, f, indent=2)
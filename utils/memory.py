@@ -0,0 +1,71 @@
+import os
+import threading
+
+# How often PeakMemory samples the resident set size, in seconds.
+SAMPLE_INTERVAL = 0.05
+
+_setups = {"count": 0, "peak": 0, "max_growth": 0}
+_setups_lock = threading.Lock()
+
+
+def rss_bytes():
+    """Current resident set size of this process, or 0 where it cannot be read."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class PeakMemory:
+    """Context manager recording the process's peak RSS while its block runs.
+
+    RSS is sampled from a background thread, so short spikes between samples
+    can be missed. Other threads of the process count too: with several
+    setups running in one worker, the peak covers all of them.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.start = self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, rss_bytes())
+
+    def __enter__(self):
+        self.start = self.peak = rss_bytes()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_bytes())
+        return False
+
+    def summary(self):
+        mb = 1024 * 1024
+        return f"peak RSS {self.peak / mb:.0f} MB (+{(self.peak - self.start) / mb:.0f} MB)"
+
+
+def record_setup_memory(memory):
+    """Fold one setup's PeakMemory into the stats reported by memory_stats()."""
+    with _setups_lock:
+        _setups["count"] += 1
+        _setups["peak"] = max(_setups["peak"], memory.peak)
+        _setups["max_growth"] = max(_setups["max_growth"], memory.peak - memory.start)
+
+
+def memory_stats():
+    mb = 1024 * 1024
+    with _setups_lock:
+        return {
+            "rss_mb": round(rss_bytes() / mb, 1),
+            "setups": _setups["count"],
+            "setup_peak_rss_mb": round(_setups["peak"] / mb, 1),
+            "setup_max_growth_mb": round(_setups["max_growth"] / mb, 1),
+        }
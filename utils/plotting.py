@@ -1,135 +1,182 @@
 import os
-import ast
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 import seaborn as sns
 from wordcloud import WordCloud
-from pyvis.network import Network
-from flask import session
 import json
+import time
+import shutil
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 import matplotlib
+from matplotlib.figure import Figure
+from utils.files import replacing, user_dir, TEMP_DIR
+from utils.aggregates import read_aggregates, PLAYCOUNT_METRIC, PLAYCOUNT_METRIC_LABELS
 matplotlib.use("Agg")
 
+
 def ensure_dir(path):
     os.makedirs(path, exist_ok=True)
     return path
 
-def load_user_data(user_id):
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    project_root = os.path.dirname(current_dir)
-    user_dir = os.path.join(project_root, "temp", user_id)
-
-    csv_files = ["top_tracks.csv", "recent_tracks.csv", "user_songs.csv"]
-    datasets_dir = os.path.join("temp", user_id, "datasets")
-    dfs = [pd.read_csv(os.path.join(datasets_dir, f)) for f in csv_files if os.path.exists(os.path.join(datasets_dir, f))]
-    if not dfs:
-        raise FileNotFoundError(f"No CSVs found for user at {user_dir}")
-    df = pd.concat(dfs, ignore_index=True)
-
-    drop_cols = ['similar_songs', 'name_url', 'artist_url', 'album_url', 'album_art', 'popularity']
-    df.drop(columns=[c for c in drop_cols if c in df.columns], inplace=True)
-    df.dropna(inplace=True)
+PLOT_EXPO = "plot_expo.json"
 
-    df['genres'] = df['genres'].apply(ast.literal_eval)
-    df['genres'] = df['genres'].apply(lambda lst: ['hip hop' if g.lower() in ['hip-hop', 'hip hop'] else g for g in lst])
-    df['genres'] = df['genres'].apply(lambda lst: sorted(set(lst)))
-    df = df[df['genres'].apply(lambda x: len(x) > 0)]
-    return df
+def write_plot_explanations(plots_dir, explanations):
+    """Write all plot explanations as one manifest, replacing the old one atomically.
 
+    Readers either see the previous manifest or the new one, never a partly
+    written file.
+    """
+    expo_path = os.path.join(plots_dir, PLOT_EXPO)
+    with replacing(expo_path) as tmp_path, open(tmp_path, "w") as f:
+        json.dump(explanations, f, indent=2)
 
-def save_plot_explanation(plots_dir, plot_name, explanation):
-    expo_path = os.path.join(plots_dir, "plot_expo.json")
-
-    if os.path.exists(expo_path):
-        with open(expo_path, "r") as f:
-            data = json.load(f)
-    else:
-        data = {}
-
-    data[plot_name] = explanation
-
-    with open(expo_path, "w") as f:
-        json.dump(data, f, indent=2)
-def plot_wordcloud_genres(df, plots_dir):
-    genre_counts = df.explode('genres')['genres'].value_counts()
-
-    wc_width, wc_height = 1000, 1500
-    wc = WordCloud(
-        width=wc_width,
-        height=wc_height,
-        background_color=None,
-        mode="RGBA",
-        colormap='rainbow',
-        max_words=100,
-        prefer_horizontal=1,
-    ).generate_from_frequencies(genre_counts)
-    
-    plt.figure(figsize=(wc_width/200, wc_height/200), dpi=200, facecolor=None)
-    plt.imshow(wc, interpolation='lanczos')
-    plt.axis('off')
-    plt.tight_layout(pad=0)
-    
-    plt.savefig(
-        os.path.join(plots_dir, "wordcloud_genres.png"),
-        transparent=True,
-        bbox_inches='tight',
-        pad_inches=0
-    )
-    plt.close()
+def save_png(fig, plots_dir, plot_name):
+    """Save fig as plots_dir/<plot_name>.png, replacing any previous image atomically."""
+    path = os.path.join(plots_dir, f"{plot_name}.png")
+    with replacing(path) as tmp_path:
+        fig.savefig(tmp_path, format="png", transparent=True, bbox_inches='tight', pad_inches=0)
+    return path
 
-    top_genres = genre_counts.head(5).to_dict()
-    explanation = {
+def explain_wordcloud_genres(agg):
+    top_genres = agg["genre_counts"].set_index("genre")["count"].head(5).to_dict()
+    return {
         "summary": f"Top genres are {', '.join(top_genres.keys())}.",
         "top_genres": top_genres
     }
-    save_plot_explanation(plots_dir, "wordcloud_genres", explanation)
-    
-def plot_wordcloud_artists(df, plots_dir):
-    artist_counts = df['artist'].value_counts()
-
-    wc_width, wc_height = 1000, 1500
-    wc = WordCloud(
-        width=wc_width,
-        height=wc_height,
-        background_color=None,
-        mode='RGBA',
-        colormap='rainbow',
-        max_words=100,
-        prefer_horizontal=1,
-    ).generate_from_frequencies(artist_counts)
-    
-    plt.figure(figsize=(wc_width/200, wc_height/200), dpi=200, facecolor=None)
-    plt.imshow(wc, interpolation='lanczos')
-    plt.axis('off')
-    plt.tight_layout(pad=0)
-    
-    plt.savefig(
-        os.path.join(plots_dir, "wordcloud_artists.png"),
-        transparent=True,
-        bbox_inches='tight',
-        pad_inches=0
-    )
-    plt.close()
 
-    top_artists = artist_counts.head(5).to_dict()
-    explanation = {
+def explain_wordcloud_artists(agg):
+    top_artists = agg["artist_counts"].set_index("artist")["count"].head(5).to_dict()
+    return {
         "summary": f"Most listened artists include {', '.join(top_artists.keys())}.",
         "top_artists": top_artists
     }
-    save_plot_explanation(plots_dir, "wordcloud_artists", explanation)
 
-def plot_playcount_distribution(df, plots_dir):
-    df_exploded = df.explode('genres')
-    
-    df_exploded["playcount"] = pd.to_numeric(df_exploded["playcount"], errors="coerce").fillna(0)
-    
-    log_playcounts = np.log1p(df_exploded["playcount"])
+def explain_playcount_distribution(agg):
+    totals = agg["playlist_totals"]
+    label = PLAYCOUNT_METRIC_LABELS[PLAYCOUNT_METRIC]
+    top_playlists = (
+        totals.set_index("playlist")["playcount"]
+        .sort_values(ascending=False, kind="stable")
+        .head(5)
+        .to_dict()
+    )
+    summary = f"Top 5 playlists with the highest total {label} across their tracks' artists."
+    unmeasured = int((totals["tracks"] - totals["measured"]).sum())
+    if unmeasured:
+        summary += f" {unmeasured} tracks whose artist has no {label} figure are left out."
+    return {
+        "summary": summary,
+        "top_playlists": top_playlists
+    }
+
+def explain_polar_playcount_playlist(agg):
+    years = agg["year_counts"]["year"]
+    min_year, max_year = int(years.min()), int(years.max())
+    # Empty when no artist has a value for the playcount metric.
+    peak_year = int(agg["top_tracks"]["year"].iloc[0]) if len(agg["top_tracks"]) else None
+    top_tracks = agg["top_tracks"].head(5).set_index('name')['playcount'].to_dict()
+
+    summary = f"Listening history spans from {min_year} to {max_year}"
+    if peak_year is not None:
+        summary += (f", with peak popularity in {peak_year}. "
+                    f"Top tracks include {', '.join(list(top_tracks.keys())[:4])}.")
+    else:
+        summary += "."
+    return {
+        "min_year": min_year,
+        "max_year": max_year,
+        "peak_playcount_year": peak_year,
+        "top_5_tracks": top_tracks,
+        "summary": summary,
+    }
+
+WORDCLOUD_SIZE = (1000, 1500)
+WORDCLOUD_MAX_WORDS = 100
+# Rendered word clouds, keyed by a hash of their frequency table.
+WORDCLOUD_CACHE_DIR = os.path.join(TEMP_DIR, "wordclouds")
+WORDCLOUD_CACHE_ENTRIES = int(os.environ.get("PLAYLISTR_WORDCLOUD_CACHE_ENTRIES", 500))
+
+# Word cloud plots and the aggregate table and column their words come from.
+WORDCLOUD_PLOTS = {
+    "wordcloud_genres": ("genre_counts", "genre"),
+    "wordcloud_artists": ("artist_counts", "artist"),
+}
+
+def wordcloud_frequencies(agg, plot_name):
+    table, column = WORDCLOUD_PLOTS[plot_name]
+    return agg[table].head(WORDCLOUD_MAX_WORDS).set_index(column)["count"]
+
+def wordcloud_key(frequencies):
+    h = hashlib.sha256(f"{WORDCLOUD_SIZE}".encode())
+    for word, count in frequencies.items():
+        h.update(f"{word}\t{count}\n".encode())
+    return h.hexdigest()
+
+def _prune_wordcloud_cache():
+    entries = []
+    for entry in os.scandir(WORDCLOUD_CACHE_DIR):
+        if entry.name.endswith(".png"):
+            try:
+                entries.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                pass
+    entries.sort()
+    for _, path in entries[:max(0, len(entries) - WORDCLOUD_CACHE_ENTRIES)]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def save_wordcloud(frequencies, plots_dir, plot_name):
+    """Save a word cloud of frequencies as plots_dir/<plot_name>.png.
+
+    The WordCloud image is written straight to PNG. Images are cached by
+    their frequency table, so an unchanged word list reuses the previous
+    image instead of running the layout again.
+    """
+    cached_path = os.path.join(ensure_dir(WORDCLOUD_CACHE_DIR), f"{wordcloud_key(frequencies)}.png")
+    try:
+        # Touch the entry so pruning drops the least recently used ones.
+        os.utime(cached_path)
+    except FileNotFoundError:
+        width, height = WORDCLOUD_SIZE
+        wc = WordCloud(
+            width=width,
+            height=height,
+            background_color=None,
+            mode="RGBA",
+            colormap='rainbow',
+            max_words=WORDCLOUD_MAX_WORDS,
+            prefer_horizontal=1,
+        ).generate_from_frequencies(frequencies)
+
+        with replacing(cached_path) as tmp_path:
+            wc.to_image().save(tmp_path, format="PNG")
+        _prune_wordcloud_cache()
+
+    path = os.path.join(plots_dir, f"{plot_name}.png")
+    with replacing(path) as tmp_path:
+        shutil.copyfile(cached_path, tmp_path)
+    return path
+
+def plot_wordcloud_genres(agg, plots_dir):
+    save_wordcloud(wordcloud_frequencies(agg, "wordcloud_genres"), plots_dir, "wordcloud_genres")
+
+def plot_wordcloud_artists(agg, plots_dir):
+    save_wordcloud(wordcloud_frequencies(agg, "wordcloud_artists"), plots_dir, "wordcloud_artists")
+
+def plot_playcount_distribution(agg, plots_dir):
+    hist = agg["playcount_hist"]
 
-    fig, ax = plt.subplots(figsize=(6, 9), dpi=200, facecolor=None) 
+    fig = Figure(figsize=(6, 9), dpi=200, facecolor=None)
+    ax = fig.add_subplot()
     sns.kdeplot(
-        data=df_exploded,
-        y=log_playcounts,
+        data=hist,
+        y='log_playcount',
+        weights='count',
         hue='playlist',
         multiple='fill',
         fill=True,
@@ -144,94 +191,66 @@ def plot_playcount_distribution(df, plots_dir):
 
     ax.set_axis_off()
     ax.set_facecolor(None)
-    plt.subplots_adjust(left=0, right=1, top=1, bottom=0)
-
-    plt.savefig(
-        os.path.join(plots_dir, "playcount_distribution.png"),
-        transparent=True,
-        bbox_inches='tight',
-        pad_inches=0
-    )
-    plt.close()
-
-    top_playlists = (
-        df_exploded.groupby("playlist")["playcount"]
-        .sum()
-        .sort_values(ascending=False)
-        .head(5)
-        .to_dict()
-    )
-
-    explanation = {
-        "summary": "Top 5 playlists with the highest total playcounts.",
-        "top_playlists": top_playlists
-    }
-
-    save_plot_explanation(plots_dir, "playcount_distribution", explanation)
-
-def get_artist_genre_playlist_network_html(df, plots_dir):
-    df_exploded = df.explode('genres')
-    top_artists = df['artist'].value_counts().head(30).index
-    top_genres = df_exploded['genres'].value_counts().head(20).index
-    top_playlists = df['playlist'].value_counts().head(5).index
-
-    df_filtered = df[df['artist'].isin(top_artists)]
-    df_filtered = df_filtered[df_filtered['playlist'].isin(top_playlists)]
-    df_filtered = df_filtered[df_filtered['genres'].apply(lambda gs: any(g in top_genres for g in gs))]
-    df_exploded_edges = df_filtered.explode('genres')
-
-    net = Network(height="100vh", 
-                  width="100%", 
-                  bgcolor="rgba(0,0,0,0)",
-                  notebook=True,
-                  cdn_resources='in_line'
-                  )
-    
-    net.force_atlas_2based()
-    net.set_edge_smooth(smooth_type='discrete')
-    net.set_edge_smooth(smooth_type='straightCross')
-
-    for artist in top_artists:
-        net.add_node(artist, label=artist, color="#4bd183", mass=1,
-                     font={"color": "#636363", "size": 18, "face": "helvetica"}, title=f"Artist: {artist}")
-
-    for genre in top_genres:
-        net.add_node(genre, label=genre, shape='circle', mass=2,
-                     color="#6d5dfc", font={"color": "#E4EBF5", "size": 18, "face": "helvetica"}, title=f"Genre: {genre}")
-
-    for pl in top_playlists:
-        net.add_node(pl, label=pl, shape='circle', mass=3,
-                     color="#ff4400", font={"color": "#ffffff", "size": 18, "face": "helvetica"}, title=f"Playlist: {pl}")
-
-    for _, row in df_exploded_edges.iterrows():
-        if row['genres'] in top_genres:
-            net.add_edge(row['artist'], row['genres'], color="#4D4D4D50", title="Artist ↔ Genre")
-        if row['genres'] in top_genres and row['playlist'] in top_playlists:
-            net.add_edge(row['genres'], row['playlist'], color="#88888850", title="Genre ↔ Playlist")
-
+    fig.subplots_adjust(left=0, right=1, top=1, bottom=0)
+
+    save_png(fig, plots_dir, "playcount_distribution")
+
+def build_network_graph(agg, n_artists=30, n_genres=20, n_playlists=5):
+    """Nodes and weighted edges linking the top artists, genres and playlists.
+
+    Edge weights are the number of (track, genre) rows behind each link,
+    summed with group-bys over the co-occurrence table, so every pair appears
+    once. Nodes are {"id", "label", "group"}; edges are [from, to, weight].
+    """
+    top_artists = agg["artist_counts"]["artist"].head(n_artists)
+    top_genres = agg["genre_counts"]["genre"].head(n_genres)
+    top_playlists = agg["playlist_totals"]["playlist"].head(n_playlists)
+
+    nodes = []
+    node_ids = {}
+    for group, names in [("artist", top_artists), ("genre", top_genres), ("playlist", top_playlists)]:
+        for name in names:
+            node_ids[group, name] = len(nodes)
+            nodes.append({"id": len(nodes), "label": name, "group": group})
+
+    edges = agg["edges"]
+    edges = edges[edges["artist"].isin(top_artists) & edges["genre"].isin(top_genres)
+                  & edges["playlist"].isin(top_playlists)]
+    links = []
+    for src, dst in [("artist", "genre"), ("genre", "playlist")]:
+        weights = edges.groupby([src, dst], sort=False)["count"].sum()
+        src_ids = weights.index.get_level_values(0).map(lambda v: node_ids[src, v])
+        dst_ids = weights.index.get_level_values(1).map(lambda v: node_ids[dst, v])
+        links.extend(zip(src_ids.tolist(), dst_ids.tolist(), weights.tolist()))
+
+    graph = {"nodes": nodes, "edges": links}
     explanation = {
-    "summary": "Network shows strongest links between top artists, genres, and playlists.",
-    "top_artists": list(top_artists[:5]),
-    "top_genres": list(top_genres[:5]),
-    "top_playlists": list(top_playlists[:5])
+        "summary": "Network shows strongest links between top artists, genres, and playlists.",
+        "top_artists": top_artists.head(5).tolist(),
+        "top_genres": top_genres.head(5).tolist(),
+        "top_playlists": top_playlists.head(5).tolist(),
     }
-    save_plot_explanation(plots_dir, "artist_genre_playlist_network", explanation)
+    return graph, explanation
 
 
-    network_html = net.generate_html(notebook=False)
-    network_html = network_html.replace('<div class="card" style="width: 100%">', '<div class="card" style="width: 100%; background">')
-    network_html = network_html.replace('<head>', '<head style="background:transparent;')
-    network_html = network_html.replace('<body>', '<body style="background:transparent;')
-    network_html = network_html.replace('<div class="card" style="width: 100%">', '<div class="card" style="width: 100%; background:transparent;">')
+NETWORK_JSON = "network.json"
 
-    return network_html
+def save_network_json(agg, plots_dir):
+    """Build the network graph and store it in plots_dir for /network.json to serve."""
+    graph, explanation = build_network_graph(agg)
+    path = os.path.join(plots_dir, NETWORK_JSON)
+    with replacing(path) as tmp_path, open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(graph, f, separators=(",", ":"))
+    return explanation
 
 
-def plot_polar_playcount_playlist(df, plots_dir):
-    min_year, max_year = int(df['year'].min()), int(df['year'].max())
+def plot_polar_playcount_playlist(agg, plots_dir):
+    years = agg["year_counts"]["year"]
+    min_year, max_year = int(years.min()), int(years.max())
 
-    top_playlists = df['playlist'].value_counts().head(10).index
-    df_plot = df[df['playlist'].isin(top_playlists)].copy()
+    top_playlists = agg["playlist_totals"]["playlist"].head(10)
+    df_plot = agg["playlist_year_playcount"]
+    df_plot = df_plot[df_plot['playlist'].isin(top_playlists)]
 
     angles = 2 * np.pi * (df_plot['year'] - min_year) / (max_year - min_year)
     radii = df_plot['playcount']
@@ -249,7 +268,7 @@ def plot_polar_playcount_playlist(df, plots_dir):
     colors = df_plot['playlist'].map(playlist_to_color)
 
 
-    fig = plt.figure(figsize=(6, 9), dpi=300, facecolor=None)
+    fig = Figure(figsize=(6, 9), dpi=300, facecolor=None)
     ax = fig.add_subplot(projection='polar', facecolor=None)
 
     scatter = ax.scatter(
@@ -263,8 +282,10 @@ def plot_polar_playcount_playlist(df, plots_dir):
         linewidth=0.0,
     )
 
-    ax.set_ylim(-1_000_000, 10_500_000)
-    ax.set_rorigin(-5_000_000)
+    # Scaled to the data, as the metric may be Last.fm listeners or Spotify followers.
+    top = max(float(radii.max()) if len(radii) else 0.0, 1.0)
+    ax.set_ylim(-0.1 * top, 1.05 * top)
+    ax.set_rorigin(-0.5 * top)
     ax.set_theta_zero_location('N')
     ax.set_theta_direction(-1)
     ax.set_rlabel_position(45)
@@ -281,54 +302,168 @@ def plot_polar_playcount_playlist(df, plots_dir):
     cbar = fig.colorbar(scatter, ax=ax, orientation='horizontal', pad=0.1)
     cbar.outline.set_visible(False)
     cbar.ax.tick_params(length=0)
-    cbar.set_label("Popularity", color="#474e5f")
-
-    plt.savefig(
-        os.path.join(plots_dir, "polar_playcount_playlist.png"),
-        transparent=True,
-        bbox_inches='tight',
-        pad_inches=0
-    )
-    plt.close()
-
-    peak_playcount_idx = df['playcount'].idxmax()
-    peak_year = int(df.loc[peak_playcount_idx, 'year'])
-    top_tracks = (
-        df.sort_values('playcount', ascending=False)
-          .head(5)[['name', 'playcount']]
-          .set_index('name')['playcount']
-          .to_dict()
-    )
-
-    summary = (
-        f"Listening history spans from {min_year} to {max_year}, "
-        f"with peak popularity in {peak_year}. "
-        f"Top tracks include {', '.join(list(top_tracks.keys())[:4])}."
-    )
-
-    explanation = {
-        "min_year": min_year,
-        "max_year": max_year,
-        "peak_playcount_year": peak_year,
-        "top_5_tracks": top_tracks,
-        "summary": summary,
+    cbar.set_label(PLAYCOUNT_METRIC_LABELS[PLAYCOUNT_METRIC], color="#474e5f")
+
+    save_png(fig, plots_dir, "polar_playcount_playlist")
+
+PLOT_WORKERS = int(os.environ.get("PLAYLISTR_PLOT_WORKERS", min(5, os.cpu_count() or 1)))
+
+# Plots with a server-rendered PNG export, and the functions explaining them.
+PNG_PLOTS = {
+    "wordcloud_genres": plot_wordcloud_genres,
+    "wordcloud_artists": plot_wordcloud_artists,
+    "playcount_distribution": plot_playcount_distribution,
+    "polar_playcount_playlist": plot_polar_playcount_playlist,
+}
+PLOT_EXPLAINERS = {
+    "wordcloud_genres": explain_wordcloud_genres,
+    "wordcloud_artists": explain_wordcloud_artists,
+    "playcount_distribution": explain_playcount_distribution,
+    "polar_playcount_playlist": explain_polar_playcount_playlist,
+}
+PLOT_NAMES = ["wordcloud_genres", "wordcloud_artists", "playcount_distribution",
+              "artist_genre_playlist_network", "polar_playcount_playlist"]
+# Aggregate tables each plot is drawn and explained from.
+PLOT_TABLES = {
+    "wordcloud_genres": ["genre_counts"],
+    "wordcloud_artists": ["artist_counts"],
+    "playcount_distribution": ["playcount_hist", "playlist_totals"],
+    "artist_genre_playlist_network": ["artist_counts", "genre_counts", "playlist_totals", "edges"],
+    "polar_playcount_playlist": ["year_counts", "top_tracks", "playlist_totals", "playlist_year_playcount"],
+}
+# Charts are drawn in the browser from /chart_data. PNGs are only rendered
+# when requested, unless this is set to render them all during setup.
+PLOT_EXPORT = os.environ.get("PLAYLISTR_PLOT_EXPORT") == "1"
+
+_plot_pool = None
+
+def get_plot_pool():
+    # Spawned rather than forked: the parent runs job and HTTP threads that a
+    # forked child would inherit in an arbitrary state.
+    global _plot_pool
+    if _plot_pool is None:
+        _plot_pool = ProcessPoolExecutor(max_workers=PLOT_WORKERS,
+                                         mp_context=multiprocessing.get_context("spawn"))
+    return _plot_pool
+
+def render_plot(plot_name, user_id, plots_dir):
+    """Render one PNG from the user's stored aggregates. Runs in a plot pool worker.
+
+    Returns the plot name and the render time in seconds.
+    """
+    start = time.perf_counter()
+    PNG_PLOTS[plot_name](read_aggregates(user_id), plots_dir)
+    return plot_name, time.perf_counter() - start
+
+def user_plots_dir(user_id):
+    return os.path.join(user_dir(user_id), "plots")
+
+def export_plots(user_id, plot_names, progress=None):
+    """Render the given PNG exports on the plot pool; returns {name: seconds}."""
+    global _plot_pool
+    plots_dir = user_plots_dir(user_id)
+    timings = {}
+    pool = get_plot_pool()
+    futures = [pool.submit(render_plot, plot_name, user_id, plots_dir) for plot_name in plot_names]
+    for done, future in enumerate(as_completed(futures), start=1):
+        try:
+            plot_name, seconds = future.result()
+        except BrokenProcessPool:
+            # A worker died; start a fresh pool for the next run.
+            _plot_pool = None
+            raise
+        timings[plot_name] = round(seconds, 2)
+        print(f"[DataEDA] Rendered {plot_name} in {seconds:.2f}s")
+        if progress:
+            progress("plots", done, len(futures), f"Rendered {plot_name}")
+    return timings
+
+# Aggregate tables the dashboard's client-side charts are drawn from.
+CHART_DATA_TABLES = ["genre_counts", "artist_counts", "playcount_hist", "playlist_totals",
+                     "playlist_year_playcount", "year_counts"]
+
+def chart_data(agg, max_words=100, n_playlists=10, bin_width=0.5):
+    """Data for the dashboard's client-side charts, from the stored aggregates."""
+    hist = agg["playcount_hist"]
+    hist = hist.assign(log_playcount=(hist["log_playcount"] // bin_width) * bin_width)
+    bins = np.sort(hist["log_playcount"].unique())
+    per_playlist = hist.pivot_table(index="playlist", columns="log_playcount", values="count",
+                                    aggfunc="sum", fill_value=0).reindex(columns=bins, fill_value=0)
+
+    top_playlists = agg["playlist_totals"]["playlist"].head(n_playlists)
+    points = agg["playlist_year_playcount"]
+    points = points[points["playlist"].isin(top_playlists)]
+    years = agg["year_counts"]["year"]
+
+    return {
+        "metric": PLAYCOUNT_METRIC_LABELS[PLAYCOUNT_METRIC],
+        "genres": agg["genre_counts"].head(max_words).to_dict(orient="list"),
+        "artists": agg["artist_counts"].head(max_words).to_dict(orient="list"),
+        "playcount_distribution": {
+            "bins": bins.round(2).tolist(),
+            "playlists": {pl: row.tolist() for pl, row in per_playlist.iterrows()},
+        },
+        "polar": {
+            "min_year": int(years.min()) if len(years) else None,
+            "max_year": int(years.max()) if len(years) else None,
+            "playlists": top_playlists.tolist(),
+            "points": points.to_dict(orient="list"),
+        },
     }
 
-    save_plot_explanation(plots_dir, "polar_playcount_playlist", explanation)
-    
-def generate_all_user_plots():
-    user_id = session.get("user_info").get("id")
-    df = load_user_data(user_id)
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    project_root = os.path.dirname(current_dir)
-
-    plots_dir = os.path.join(project_root, "temp", user_id, "plots")
-
-    plot_wordcloud_genres(df, plots_dir)
-    plot_wordcloud_artists(df, plots_dir)
-    plot_playcount_distribution(df, plots_dir)
-    get_artist_genre_playlist_network_html(df, plots_dir)
-    plot_polar_playcount_playlist(df, plots_dir)
-
-    print(f"[SUCCESS] All plots saved in {plots_dir}")
-
+def generate_all_user_plots(user_id, progress=None, export=PLOT_EXPORT, manifest=None):
+    """Write the plot explanations and network graph, and the PNGs if exporting.
+
+    With a StageManifest each plot is its own stage, whose inputs are the
+    hashes of the aggregate tables it reads: plots whose tables did not
+    change keep their previous explanation and files.
+    """
+    # The setup job builds the aggregates right before this.
+    agg = read_aggregates(user_id)
+    plots_dir = ensure_dir(user_plots_dir(user_id))
+    try:
+        with open(os.path.join(plots_dir, PLOT_EXPO)) as f:
+            previous = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        previous = {}
+
+    tables = (manifest.get("aggregate") or {}).get("tables", {}) if manifest else {}
+    inputs = {name: {t: tables.get(t) for t in PLOT_TABLES[name]} for name in PLOT_NAMES}
+    stale = [name for name in PLOT_NAMES
+             if not (manifest and name in previous and manifest.is_current(f"plot:{name}", inputs[name]))]
+    if manifest and len(stale) < len(PLOT_NAMES):
+        print(f"[DataEDA] Plots unchanged for user {user_id}: "
+              + ", ".join(name for name in PLOT_NAMES if name not in stale))
+
+    start = time.perf_counter()
+    explanations = {name: previous[name] for name in PLOT_NAMES if name not in stale}
+    outputs = {name: [] for name in stale}
+    for name in stale:
+        if name == "artist_genre_playlist_network":
+            explanations[name] = save_network_json(agg, plots_dir)
+            outputs[name].append(os.path.join(plots_dir, NETWORK_JSON))
+        else:
+            explanations[name] = PLOT_EXPLAINERS[name](agg)
+
+    png_plots = [name for name in stale if name in PNG_PLOTS]
+    if export:
+        timings = export_plots(user_id, png_plots, progress)
+        for name in png_plots:
+            outputs[name].append(os.path.join(plots_dir, f"{name}.png"))
+    else:
+        timings = {}
+        if progress:
+            progress("plots", 1, 1, "Chart data ready")
+        # Exports of the previous data would be stale; they are re-rendered
+        # the next time they are requested.
+        for plot_name in png_plots:
+            path = os.path.join(plots_dir, f"{plot_name}.png")
+            if os.path.exists(path):
+                os.remove(path)
+
+    write_plot_explanations(plots_dir, {name: explanations[name] for name in PLOT_NAMES})
+    if manifest:
+        for name in stale:
+            manifest.record(f"plot:{name}", inputs[name], outputs[name])
+    print(f"[SUCCESS] All plots saved in {plots_dir} in {time.perf_counter() - start:.2f}s")
+    return timings
@@ -0,0 +1,253 @@
+import os
+import time
+import json
+import secrets
+import sqlite3
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import Signer, BadSignature
+from werkzeug.datastructures import CallbackDict
+from utils.files import replacing, TEMP_DIR
+
+# "sqlite" or "filesystem"; see make_session_interface().
+SESSION_BACKEND = os.environ.get("PLAYLISTR_SESSION_BACKEND", "sqlite")
+SESSIONS_DB = os.path.join(TEMP_DIR, "sessions.db")
+SESSIONS_DIR = os.path.join(TEMP_DIR, "sessions")
+SECRET_KEY_FILE = os.path.join(TEMP_DIR, "secret_key")
+# An unchanged session's expiry is pushed back at most this often, so
+# ordinary page views do not each write to the store.
+SESSION_TOUCH_INTERVAL = 3600
+# How often expired sessions are deleted, per process.
+SESSION_SWEEP_INTERVAL = 3600
+
+
+def load_secret_key():
+    """The app's secret key, shared by every worker process.
+
+    Taken from PLAYLISTR_SECRET_KEY when set; otherwise generated once and
+    kept in temp/secret_key, where the first process to start creates it.
+    """
+    key = os.environ.get("PLAYLISTR_SECRET_KEY")
+    if key:
+        return key
+    try:
+        with open(SECRET_KEY_FILE, "r") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        pass
+
+    os.makedirs(os.path.dirname(SECRET_KEY_FILE), exist_ok=True)
+    tmp_path = f"{SECRET_KEY_FILE}.{os.getpid()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(secrets.token_hex(32))
+    try:
+        # link() fails if another process created the key first; use theirs.
+        os.link(tmp_path, SECRET_KEY_FILE)
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(tmp_path)
+    with open(SECRET_KEY_FILE, "r") as f:
+        return f.read().strip()
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """Session data kept on the server; the cookie only carries its signed id."""
+
+    def __init__(self, initial=None, sid=None, new=False, expires=None):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.expires = expires
+        self.modified = False
+        self.previous_sid = None
+
+    def regenerate(self):
+        """Move the session to a new id, e.g. when its user authenticates.
+
+        The data is kept; the old id's stored session is deleted when the
+        response is saved, so an id planted or seen before cannot be reused.
+        """
+        self.previous_sid = self.previous_sid or self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.modified = True
+
+
+class ServerSessionInterface(SessionInterface):
+    """Flask session interface storing session data server-side.
+
+    Subclasses implement _load, _store, _delete and _sweep. Sessions expire
+    PERMANENT_SESSION_LIFETIME after they were last used. An empty session
+    is never stored and gets no cookie, so anonymous requests cost nothing.
+    """
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self):
+        self._last_sweep = 0.0
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt="playlistr-session")
+
+    def open_session(self, app, request):
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode()
+            except BadSignature:
+                sid = None
+            if sid:
+                stored = self._load(sid)
+                if stored and stored[1] > time.time():
+                    return ServerSession(self.serializer.loads(stored[0]), sid=sid, expires=stored[1])
+        return ServerSession(sid=secrets.token_urlsafe(32), new=True, expires=time.time() + lifetime)
+
+    def save_session(self, app, session, response):
+        now = time.time()
+        if now - self._last_sweep > SESSION_SWEEP_INTERVAL:
+            self._last_sweep = now
+            self._sweep(now)
+
+        if session.previous_sid:
+            self._delete(session.previous_sid)
+
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if not session:
+            if session.modified and not session.new:
+                self._delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        response.vary.add("Cookie")
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        touch = session.expires - now < lifetime - SESSION_TOUCH_INTERVAL
+        if session.modified or touch:
+            session.expires = now + lifetime
+            self._store(session.sid, self.serializer.dumps(dict(session)), session.expires)
+        if session.new or session.modified:
+            response.set_cookie(
+                name,
+                self._signer(app).sign(session.sid).decode(),
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+            )
+
+
+class SqliteSessionInterface(ServerSessionInterface):
+    def __init__(self, path=SESSIONS_DB):
+        super().__init__()
+        self.path = path
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        created = not os.path.exists(self.path)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        if created:
+            # Sessions hold users' Spotify access tokens.
+            os.chmod(self.path, 0o600)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                sid TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                expires REAL NOT NULL
+            )
+        """)
+        return conn
+
+    def _load(self, sid):
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT data, expires FROM sessions WHERE sid = ?", (sid,)).fetchone()
+        finally:
+            conn.close()
+
+    def _store(self, sid, data, expires):
+        conn = self._connect()
+        try:
+            conn.execute("INSERT OR REPLACE INTO sessions (sid, data, expires) VALUES (?, ?, ?)",
+                         (sid, data, expires))
+        finally:
+            conn.close()
+
+    def _delete(self, sid):
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+        finally:
+            conn.close()
+
+    def _sweep(self, now):
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM sessions WHERE expires < ?", (now,))
+        finally:
+            conn.close()
+
+
+class FilesystemSessionInterface(ServerSessionInterface):
+    """One JSON file per session under temp/sessions, replaced atomically on write."""
+
+    def __init__(self, directory=SESSIONS_DIR):
+        super().__init__()
+        self.directory = directory
+
+    def _path(self, sid):
+        return os.path.join(self.directory, f"{sid}.json")
+
+    def _load(self, sid):
+        try:
+            with open(self._path(sid), "r", encoding="utf-8") as f:
+                stored = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return stored["data"], stored["expires"]
+
+    def _store(self, sid, data, expires):
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        # The temporary file is created readable by this user only.
+        with replacing(self._path(sid)) as tmp_path, open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"data": data, "expires": expires}, f)
+
+    def _delete(self, sid):
+        try:
+            os.remove(self._path(sid))
+        except FileNotFoundError:
+            pass
+
+    def _sweep(self, now):
+        if not os.path.isdir(self.directory):
+            return
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json") and self._expired(entry.path, now):
+                self._delete(entry.name[:-len(".json")])
+
+    def _expired(self, path, now):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)["expires"] < now
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            return False
+
+
+SESSION_BACKENDS = {
+    "sqlite": SqliteSessionInterface,
+    "filesystem": FilesystemSessionInterface,
+}
+
+
+def make_session_interface(backend=SESSION_BACKEND):
+    if backend not in SESSION_BACKENDS:
+        raise ValueError(f"Unknown session backend {backend!r}; expected one of {', '.join(SESSION_BACKENDS)}")
+    return SESSION_BACKENDS[backend]()
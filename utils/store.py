@@ -0,0 +1,230 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from utils.files import replacing, user_dir
+
+# Column types for the per-user track datasets. Columns not listed here are
+# stored with the type pyarrow infers for them.
+TRACK_SCHEMA = {
+    "playlist": pa.string(),
+    "playlist_id": pa.string(),
+    "snapshot_id": pa.string(),
+    "name": pa.string(),
+    "name_url": pa.string(),
+    "artist": pa.string(),
+    "artist_id": pa.string(),
+    "artist_url": pa.string(),
+    "album": pa.string(),
+    "album_url": pa.string(),
+    "year": pa.int32(),
+    "album_art": pa.string(),
+    "genres": pa.list_(pa.string()),
+    "playcount": pa.int64(),
+    "followers": pa.int64(),
+    "popularity": pa.int32(),
+    "similar_songs": pa.list_(pa.struct([("name", pa.string()), ("artist", pa.string())])),
+}
+
+
+# Memory budget for loaded datasets kept by cached() in this process.
+FRAME_CACHE_BYTES = int(os.environ.get("PLAYLISTR_FRAME_CACHE_MB", 256)) * 1024 * 1024
+
+_frame_cache = OrderedDict()
+_frame_cache_bytes = 0
+_frame_cache_lock = threading.Lock()
+
+
+def datasets_dir(user_id):
+    return os.path.join(user_dir(user_id), "datasets")
+
+
+def dataset_path(user_id, name):
+    return os.path.join(datasets_dir(user_id), f"{name}.parquet")
+
+
+def dataset_exists(user_id, name):
+    return os.path.exists(dataset_path(user_id, name))
+
+
+def _schema_for(df):
+    fields = []
+    for col in df.columns:
+        if col in TRACK_SCHEMA:
+            fields.append(pa.field(col, TRACK_SCHEMA[col]))
+        else:
+            fields.append(pa.field(col, pa.array(df[col], from_pandas=True).type))
+    return pa.schema(fields)
+
+
+def write_dataset(user_id, name, df):
+    """Write df as the user's ``name`` dataset, replacing any previous version atomically."""
+    path = dataset_path(user_id, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = pa.Table.from_pandas(df, schema=_schema_for(df), preserve_index=False)
+    with replacing(path) as tmp_path:
+        pq.write_table(table, tmp_path)
+    invalidate(user_id)
+    return path
+
+
+class DatasetWriter:
+    """Write a user's dataset chunk by chunk, as parquet row groups.
+
+    Chunks go to a temporary file as they arrive, so rows need not be held
+    in memory until the whole dataset is known. close() replaces the
+    dataset atomically; abort() discards what was written. ``columns``
+    fixes the schema up front from TRACK_SCHEMA, which also lets a dataset
+    without any rows be written.
+    """
+
+    def __init__(self, user_id, name, columns=None):
+        self.user_id = user_id
+        self.path = dataset_path(user_id, name)
+        self.tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        self.schema = pa.schema([pa.field(c, TRACK_SCHEMA[c]) for c in columns]) if columns else None
+        self.rows = 0
+        self._writer = None
+
+    def write(self, df):
+        if self.schema is None:
+            self.schema = _schema_for(df)
+        if self._writer is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._writer = pq.ParquetWriter(self.tmp_path, self.schema)
+        table = pa.Table.from_pandas(df[self.schema.names], schema=self.schema, preserve_index=False)
+        self._writer.write_table(table)
+        self.rows += len(df)
+
+    def close(self):
+        if self._writer is None:
+            if self.schema is None:
+                raise ValueError(f"Nothing written to {self.path} and no columns given")
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._writer = pq.ParquetWriter(self.tmp_path, self.schema)
+        self._writer.close()
+        os.replace(self.tmp_path, self.path)
+        invalidate(self.user_id)
+        return self.path
+
+    def abort(self):
+        if self._writer is not None:
+            self._writer.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+def iter_dataset(user_id, name, columns=None, batch_rows=65536):
+    """Yield the dataset as DataFrames of at most batch_rows rows; nothing if it does not exist.
+
+    Requested columns the dataset does not have are skipped.
+    """
+    path = dataset_path(user_id, name)
+    if not os.path.exists(path):
+        return
+    parquet = pq.ParquetFile(path)
+    if columns is not None:
+        columns = [c for c in columns if c in parquet.schema_arrow.names]
+    for batch in parquet.iter_batches(batch_size=batch_rows, columns=columns):
+        yield batch.to_pandas()
+
+
+def read_table(user_id, name, columns=None):
+    """Return the dataset as a pyarrow Table, or None if it has not been written."""
+    path = dataset_path(user_id, name)
+    if not os.path.exists(path):
+        return None
+    if columns is not None:
+        available = set(pq.read_schema(path).names)
+        columns = [c for c in columns if c in available]
+    return pq.read_table(path, columns=columns)
+
+
+def read_dataset(user_id, name, columns=None):
+    """Return the dataset as a DataFrame, or None if it has not been written.
+
+    Only ``columns`` are read when given; requested columns the dataset does
+    not have are skipped. List columns come back as numpy arrays.
+    """
+    table = read_table(user_id, name, columns)
+    return table.to_pandas() if table is not None else None
+
+
+def read_records(user_id, name, columns=None):
+    """Return the dataset as a list of plain dicts with Python lists, for templates."""
+    table = read_table(user_id, name, columns)
+    return table.to_pylist() if table is not None else []
+
+
+def _signature(user_id, names):
+    signature = []
+    for name in names:
+        # Dataset names, or file names (with an extension) of other files
+        # in the user's datasets directory, such as aggregates.db.
+        path = os.path.join(datasets_dir(user_id), name) if os.path.splitext(name)[1] else dataset_path(user_id, name)
+        try:
+            st = os.stat(path)
+            signature.append((name, st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            signature.append((name, None, None))
+    return tuple(signature)
+
+
+def _nbytes(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, tuple):
+        return sum(_nbytes(v) for v in value)
+    if isinstance(value, list):
+        return sum(sys.getsizeof(r) + sum(sys.getsizeof(v) for v in r.values()) for r in value)
+    return sys.getsizeof(value)
+
+
+def _evict(key):
+    global _frame_cache_bytes
+    entry = _frame_cache.pop(key, None)
+    if entry:
+        _frame_cache_bytes -= entry[2]
+
+
+def cached(user_id, key, names, loader):
+    """Return loader(), memoized per process until any of ``names`` is rewritten.
+
+    Entries are keyed by user and ``key`` and validated against the mtime and
+    size of the user's dataset files, so a rewrite from another process is
+    picked up too. ``names`` may also hold file names such as
+    "aggregates.db" for other files in the datasets directory. Least recently used entries are dropped once the cache
+    exceeds FRAME_CACHE_BYTES. Cached values are shared: callers must not
+    modify them in place.
+    """
+    global _frame_cache_bytes
+    cache_key = (user_id, key)
+    signature = _signature(user_id, names)
+    with _frame_cache_lock:
+        entry = _frame_cache.get(cache_key)
+        if entry and entry[0] == signature:
+            _frame_cache.move_to_end(cache_key)
+            return entry[1]
+
+    value = loader()
+    nbytes = _nbytes(value)
+    if nbytes > FRAME_CACHE_BYTES:
+        return value
+
+    with _frame_cache_lock:
+        _evict(cache_key)
+        _frame_cache[cache_key] = (signature, value, nbytes)
+        _frame_cache_bytes += nbytes
+        while _frame_cache_bytes > FRAME_CACHE_BYTES:
+            _evict(next(iter(_frame_cache)))
+    return value
+
+
+def invalidate(user_id):
+    """Drop every cached value for user_id."""
+    with _frame_cache_lock:
+        for key in [k for k in _frame_cache if k[0] == user_id]:
+            _evict(key)
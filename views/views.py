@@ -1,13 +1,22 @@
-from flask import Blueprint, session, render_template, jsonify, request, send_from_directory, send_file, redirect, url_for
+from flask import Blueprint, session, render_template, jsonify, request, send_from_directory, send_file, redirect, url_for, Response
 import os, ssl, smtplib
 import os
 import csv 
 import json 
-import ast
-import pandas as pd
-from utils.plotting import load_user_data, get_artist_genre_playlist_network_html
+import hashlib
+from utils.plotting import save_network_json, chart_data as build_chart_data, export_plots, user_plots_dir, NETWORK_JSON, PLOT_EXPO, PNG_PLOTS, CHART_DATA_TABLES
+from utils.aggregates import read_aggregates, aggregates_path, AGGREGATES_DB
+from utils.cache import cache_metrics
+from utils.files import PROJECT_ROOT
+from utils.store import read_records, cached
+from auth.client import limiter_stats, flight_stats
+from utils.memory import memory_stats
 import subprocess
 
+# Spotify user ids allowed to read /metrics, comma separated. The stats cover
+# every user of the process, so other users may not, and with none set no one can.
+METRICS_USERS = {u.strip() for u in os.environ.get("PLAYLISTR_METRICS_USERS", "").split(",") if u.strip()}
+
 def read_csv(path):
     if not os.path.exists(path):
         return []
@@ -23,15 +32,15 @@ def read_json(path):
         except json.JSONDecodeError:
             return {}
 
-def read_tracks_csv(path):
-    if not os.path.exists(path):
-        return []
-    df = pd.read_csv(path)
-    for col in ["genres", "similar_songs"]:
-        if col in df.columns:
-            df[col] = df[col].apply(lambda x: ast.literal_eval(x) if pd.notna(x) else [])
+def read_tracks(user_id, name):
+    def load():
+        records = read_records(user_id, name)
+        for record in records:
+            for col in ["genres", "similar_songs"]:
+                record[col] = record.get(col) or []
+        return records
 
-    return df.to_dict(orient="records")
+    return cached(user_id, name, [name], load)
 
 views_bp = Blueprint('views', __name__)
 @views_bp.route("/")
@@ -45,9 +54,8 @@ def tracks():
     top_tracks = recent_tracks = None
 
     if user_info:
-        user_dir = os.path.join("temp", user_info["id"], "datasets")
-        top_tracks = read_tracks_csv(os.path.join(user_dir, "top_tracks.csv"))
-        recent_tracks = read_tracks_csv(os.path.join(user_dir, "recent_tracks.csv"))
+        top_tracks = read_tracks(user_info["id"], "top_tracks")
+        recent_tracks = read_tracks(user_info["id"], "recent_tracks")
 
     return render_template(
         "pages/tracks.html",
@@ -75,15 +83,13 @@ def data():
     plot_json = None
 
     if user_info:
-        plots_dir = os.path.join("temp", user_info["id"], "plots")
+        plots_dir = user_plots_dir(user_info["id"])
         if os.path.exists(plots_dir):
             plot_images = [fname for fname in os.listdir(plots_dir) if fname.endswith(".png")]
             plot_images.sort()
 
-            json_path = os.path.join(plots_dir, "plot_expo.json")
-            if os.path.exists(json_path):
-                with open(json_path, "r") as f:
-                    plot_json = json.load(f)
+            # The manifest is replaced atomically once all plots are rendered.
+            plot_json = read_json(os.path.join(plots_dir, PLOT_EXPO)) or None
 
     return render_template(
         "pages/data.html",
@@ -98,30 +104,62 @@ def user_plot_data():
     if not user_info:
         return {}, 403
 
-    plot_file = os.path.join("temp", user_info["id"], "plots", "plot_expo.json")
-    if not os.path.exists(plot_file):
+    plot_json = read_json(os.path.join(user_plots_dir(user_info["id"]), PLOT_EXPO))
+    if not plot_json:
         return {}, 404
-
-    with open(plot_file, "r") as f:
-        plot_json = json.load(f)
     return plot_json
     
     
+@views_bp.route("/chart_data")
+def chart_data():
+    user_info = session.get("user_info")
+    if not user_info:
+        return {}, 403
+    user_id = user_info["id"]
+    if not os.path.exists(aggregates_path(user_id)):
+        return {}, 404
+
+    # Built once per aggregates.db; the dashboard asks for it on every visit.
+    def load():
+        body = json.dumps(build_chart_data(read_aggregates(user_id, CHART_DATA_TABLES)), separators=(",", ":")).encode()
+        return body, hashlib.sha256(body).hexdigest()
+
+    body, etag = cached(user_id, "chart_data", [AGGREGATES_DB], load)
+    response = Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
 @views_bp.route("/network")
 def network():
+    return render_template("network.html")
+
+@views_bp.route("/network.json")
+def network_data():
     user_info = session.get('user_info')
+    if not user_info:
+        return {}, 403
     user_id = user_info.get('id')
-    df = load_user_data(user_id)
-    plots_dir = os.path.join("temp", user_id, "plots")
-    net_html = get_artist_genre_playlist_network_html(df, plots_dir)
-    return net_html
+    plots_dir = user_plots_dir(user_id)
+    json_path = os.path.join(plots_dir, NETWORK_JSON)
+
+    # The plot stage rebuilds the graph whenever the tables it is drawn from
+    # change; only build it here, from the aggregates, if it is missing.
+    if not os.path.exists(json_path):
+        if not os.path.exists(aggregates_path(user_id)):
+            return {}, 404
+        agg = read_aggregates(user_id, ["artist_counts", "genre_counts", "playlist_totals", "edges"])
+        os.makedirs(plots_dir, exist_ok=True)
+        save_network_json(agg, plots_dir)
+
+    return send_from_directory(plots_dir, NETWORK_JSON, mimetype="application/json", max_age=0)
 
 @views_bp.route("/user_plots/<filename>")
 def user_plots(filename):
     user_info = session.get("user_info")
 
     if filename == "plot_json_placeholder.json":
-        placeholder_path = os.path.join("static", "img", "placeholder", "plot_json.json")
+        placeholder_path = os.path.join(PROJECT_ROOT, "static", "img", "placeholder", "plot_json.json")
         if os.path.exists(placeholder_path):
             return send_file(placeholder_path, mimetype="application/json")
         else:
@@ -131,13 +169,26 @@ def user_plots(filename):
         return "User not logged in", 403
 
     user_id = user_info["id"]
-    plots_dir = os.path.join("temp", user_id, "plots")
+    plots_dir = user_plots_dir(user_id)
 
     file_path = os.path.join(plots_dir, filename)
+    plot_name, ext = os.path.splitext(filename)
+    if (not os.path.exists(file_path) and ext == ".png" and plot_name in PNG_PLOTS
+            and os.path.exists(aggregates_path(user_id))):
+        # PNGs are an export of the client-side charts, rendered full size on request.
+        export_plots(user_id, [plot_name])
     if not os.path.exists(file_path):
         return "File not found", 404
 
-    return send_from_directory(plots_dir, filename)
+    return send_from_directory(plots_dir, filename, max_age=0)
+
+@views_bp.route("/metrics")
+def metrics():
+    user_info = session.get("user_info")
+    if not user_info or user_info.get("id") not in METRICS_USERS:
+        return {}, 403
+    return jsonify({"cache": cache_metrics(), "upstreams": limiter_stats(), "coalescing": flight_stats(),
+                    "memory": memory_stats()})
 
 @views_bp.route("/register", methods=["POST"])
 def register():